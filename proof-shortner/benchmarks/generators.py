@@ -0,0 +1,222 @@
+from typing import Iterable, List, Optional, Tuple
+
+from pb_constraint import PBConstraint
+from propagator import Propagator
+
+Constraint = Tuple[List[int], List[int], int]  # literals, coefficients, degree
+
+
+def format_constraint(literals: Iterable[int], coefficients: Iterable[int], degree: int) -> str:
+    temp = ""
+    for literal, coefficient in zip(literals, coefficients):
+        temp += ("%+d x%d " % (coefficient, literal)) if literal > 0 else ("%+d ~x%d " % (coefficient, -literal))
+    return temp + ">= " + str(degree) + " ;"
+
+
+def write_model(filename: str, constraints: List[Constraint], description: str) -> None:
+    no_of_variables = max((abs(i) for literals, _, _ in constraints for i in literals), default=0)
+    with open(filename, "w") as f:
+        f.write("* #variable= %d #constraint= %d\n" % (no_of_variables, len(constraints)))
+        f.write("* " + description + "\n")
+        for constraint in constraints:
+            f.write(format_constraint(*constraint) + "\n")
+
+
+def php_model(holes: int) -> List[Constraint]:
+    """
+    :return: the pigeonhole principle PHP(holes + 1, holes) as in `cnfgen -of opb php`; pigeon p sits in
+    hole h iff x(p * holes + h + 1).
+    """
+    pigeons = holes + 1
+    constraints = []
+    for p in range(pigeons):
+        literals = [p * holes + h + 1 for h in range(holes)]
+        constraints.append((literals, [1] * holes, 1))
+    for h in range(holes):
+        literals = [p * holes + h + 1 for p in range(pigeons)]
+        constraints.append((literals, [-1] * pigeons, -1))
+    return constraints
+
+
+def php_cutting_planes_proof(holes: int) -> List[str]:
+    """
+    :return: the lines of a cutting planes refutation of `php_model(holes)`: summing all pigeon and hole
+    constraints one `p` step at a time ends in 0 >= 1.
+    """
+    no_of_formulas = 2 * holes + 1
+    lines = ["pseudo-Boolean proof version 1.0", "f %d 0" % no_of_formulas, "p 1 2 + 0"]
+    for cid in range(3, no_of_formulas + 1):
+        lines.append("p %d %d + 0" % (no_of_formulas + cid - 3 + 1, cid))
+    lines.append("c %d 0" % (2 * no_of_formulas - 1))
+    return lines
+
+
+def sudoku_model(box: int, givens: List[List[int]]) -> List[Constraint]:
+    """
+    :param: box: the box size, the grid has box^2 rows, columns and values
+    :param: givens: the grid with 0 for empty cells
+    :return: the direct encoding of the puzzle, cell (r, c) holds v iff x(r * n^2 + c * n + v) with n = box^2.
+    """
+    n = box * box
+
+    def variable(r, c, v):
+        return r * n * n + c * n + v
+
+    constraints = []
+
+    def exactly_one(literals):
+        constraints.append((literals, [1] * len(literals), 1))
+        constraints.append((literals, [-1] * len(literals), -1))
+
+    for r in range(n):
+        for c in range(n):
+            exactly_one([variable(r, c, v) for v in range(1, n + 1)])
+    for v in range(1, n + 1):
+        for i in range(n):
+            exactly_one([variable(i, c, v) for c in range(n)])
+            exactly_one([variable(r, i, v) for r in range(n)])
+        for br in range(0, n, box):
+            for bc in range(0, n, box):
+                exactly_one([variable(br + r, bc + c, v) for r in range(box) for c in range(box)])
+    for r in range(n):
+        for c in range(n):
+            if givens[r][c]:
+                constraints.append(([variable(r, c, givens[r][c])], [1], 1))
+    return constraints
+
+
+def sudoku_givens(box: int, holes: int, perturb: bool = False) -> List[List[int]]:
+    """
+    :return: the canonical solved grid with the first `holes` cells (row by row) emptied. With `perturb`, the
+    first cell is given a different value that clashes with none of the remaining givens, which usually
+    leaves the puzzle unsatisfiable without unit propagation noticing.
+    """
+    n = box * box
+    grid = [[(box * (r % box) + r // box + c) % n + 1 for c in range(n)] for r in range(n)]
+    for k in range(min(holes, n * n)):
+        grid[k // n][k % n] = 0
+    if perturb:
+        seen = set(grid[0]) | {grid[r][0] for r in range(n)} | {grid[r][c] for r in range(box) for c in range(box)}
+        value = next((v for v in range(2, n + 1) if v not in seen), None)  # the solution has 1 there
+        if value is not None:
+            grid[0][0] = value
+    return grid
+
+
+class DPLLProofLogger:
+    """
+    Refutes a model by DPLL search with the checker's own propagator and logs a RUP proof of it: every
+    failed branch, given by its decisions d1 ... dk, becomes `u ~d1 ... ~dk >= 1`. Once both branches of a
+    decision have been refuted, the clause without it is again RUP. A refuted root ends with `u >= 1` and a
+    `c` step; a satisfiable model leaves the logged steps without a contradiction.
+    """
+
+    def __init__(self, constraints: List[Constraint], variables: Iterable[int]):
+        self.propagator = Propagator()
+        for cid, (literals, coefficients, degree) in enumerate(constraints, 1):
+            self.propagator.add(cid, PBConstraint(literals, coefficients, degree))
+        self.variables = sorted(variables)
+        self.no_of_formulas = len(constraints)
+        self.lines: List[str] = []
+
+    def propagate(self, decisions: List[int]) -> Optional[set]:
+        """
+        :return: the literals true after propagating `decisions`, None on a conflict.
+        """
+        propagator = self.propagator
+        propagator.add(-1, PBConstraint(decisions, [1] * len(decisions), len(decisions)))
+        try:
+            if propagator.falsified or propagator.propagate():
+                return None
+            return set(propagator.trail)
+        finally:
+            propagator.backtrack()
+            propagator.remove(-1)
+
+    def refute(self, decisions: List[int]) -> bool:
+        assigned = self.propagate(decisions)
+        if assigned is not None:
+            branch = next((v for v in self.variables if v not in assigned and -v not in assigned), None)
+            if branch is None or not self.refute(decisions + [branch]) or not self.refute(decisions + [-branch]):
+                return False
+        self.lines.append("u " + format_constraint([-d for d in decisions], [1] * len(decisions), 1))
+        return True
+
+    def proof(self) -> List[str]:
+        self.lines = ["pseudo-Boolean proof version 1.0", "f %d 0" % self.no_of_formulas]
+        if self.refute([]):
+            self.lines.append("c %d 0" % (self.no_of_formulas + len(self.lines) - 2))
+        return self.lines
+
+
+def chain_model(length: int) -> List[Constraint]:
+    """
+    :return: x1 and the implications x(i) -> x(i + 1), whose unit consequences are all of x1 ... x(length).
+    """
+    constraints = [([1], [1], 1)]
+    constraints += [([-i, i + 1], [1, 1], 1) for i in range(1, length)]
+    return constraints
+
+
+def chain_proof(length: int, every: int = 5) -> List[str]:
+    """
+    :return: RUP steps that each take the whole chain to check when propagated from the empty assignment.
+    """
+    lines = ["pseudo-Boolean proof version 1.0", "f %d 0" % length]
+    for k in range(1, length, every):
+        lines.append("u " + format_constraint([k, length - k + 1], [1, 1], 1))
+    return lines
+
+
+def write_instance(directory: str, name: str, constraints: List[Constraint], proof: List[str],
+                   description: str) -> Tuple[str, str]:
+    """
+    :return: the paths of the written model and proof
+    """
+    model_file = "%s/%s.opb" % (directory, name)
+    proof_file = "%s/%s.pbp" % (directory, name)
+    write_model(model_file, constraints, description)
+    with open(proof_file, "w") as f:
+        f.write("\n".join(proof) + "\n")
+    return model_file, proof_file
+
+
+def php_instances(directory: str, holes: int) -> List[Tuple[str, str, str]]:
+    """
+    :return: (name, model, proof) of the RUP and the cutting planes refutation of PHP(holes + 1, holes).
+    """
+    constraints = php_model(holes)
+    description = "Pigeonhole principle formula for %d pigeons and %d holes" % (holes + 1, holes)
+    instances = []
+    name = "php%d_rup" % holes
+    proof = DPLLProofLogger(constraints, range(1, holes * (holes + 1) + 1)).proof()
+    instances.append((name,) + write_instance(directory, name, constraints, proof, description))
+    name = "php%d_cp" % holes
+    proof = php_cutting_planes_proof(holes)
+    instances.append((name,) + write_instance(directory, name, constraints, proof, description))
+    return instances
+
+
+def sudoku_instances(directory: str, box: int, holes: int) -> List[Tuple[str, str, str]]:
+    """
+    :return: (name, model, proof) of a puzzle and of its perturbed variant; the proof logs the refuted
+    branches of the search and ends in a contradiction if the puzzle is unsatisfiable.
+    """
+    n = box * box
+    instances = []
+    for perturb in (False, True):
+        constraints = sudoku_model(box, sudoku_givens(box, holes, perturb))
+        name = "sudoku%d_%d%s" % (box, holes, "_perturbed" if perturb else "")
+        proof = DPLLProofLogger(constraints, range(1, n * n * n + 1)).proof()
+        description = "Sudoku with %dx%d boxes and %d empty cells" % (box, box, holes)
+        instances.append((name,) + write_instance(directory, name, constraints, proof, description))
+    return instances
+
+
+def chain_instances(directory: str, length: int) -> List[Tuple[str, str, str]]:
+    """
+    :return: (name, model, proof) of a unit-driven instance, see `chain_model`.
+    """
+    name = "chain%d" % length
+    description = "Implication chain of %d variables" % length
+    return [(name,) + write_instance(directory, name, chain_model(length), chain_proof(length), description)]
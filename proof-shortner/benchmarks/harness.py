@@ -0,0 +1,139 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from benchmarks.generators import chain_instances, php_instances, sudoku_instances
+from compiled import CompiledTokenizer, compile_proof
+from pb_constraint import PBProof
+from profiler import Profiler
+from tokenizer import Tokenizer
+from tracer import QUIET, Tracer
+
+
+def run_instance(name: str, model_file: str, proof_file: str) -> Dict:
+    """
+    Checks one instance; meant to run in a fresh process so that the peak RSS is its own.
+    """
+    start = time.perf_counter()
+    tokenizer = Tokenizer()
+    no_of_constraints = sum(1 for _ in tokenizer.model(model_file))
+    no_of_steps = sum(1 for _ in tokenizer.proof(proof_file))
+    parse = time.perf_counter() - start
+    compiled_file = proof_file + ".pbc"
+    compiled_bytes = compile_proof(model_file, proof_file, compiled_file)
+    start = time.perf_counter()
+    tokenizer = CompiledTokenizer()
+    sum(1 for _ in tokenizer.model(compiled_file))
+    sum(1 for _ in tokenizer.proof(compiled_file))
+    compiled_parse = time.perf_counter() - start
+    os.remove(compiled_file)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        profiler = Profiler()
+        proof = PBProof(model_file, proof_file, profiler=profiler, tracer=Tracer(QUIET))
+        total = time.perf_counter() - start
+    model = proof.model
+    report = profiler.report()
+    return {
+        "instance": name,
+        "model_bytes": os.path.getsize(model_file),
+        "proof_bytes": os.path.getsize(proof_file),
+        "compiled_bytes": compiled_bytes,
+        "model_constraints": no_of_constraints,
+        "proof_steps": no_of_steps,
+        "derived_constraints": model.no_of_constraints - proof.no_of_formulas,
+        "parse_seconds": parse,
+        "compiled_parse_seconds": compiled_parse,
+        "check_seconds": total,
+        "rules": report["rules"],
+        "constraint_classes": dict(model.propagator.class_counts),
+        "class_propagations": dict(model.propagator.class_propagations),
+        "slowest": report["slowest"][:5],
+        "constraints_per_second": model.no_of_constraints / total if total else None,
+        "steps_per_second": no_of_steps / total if total else None,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run(instances: List, repeat: int = 1) -> List[Dict]:
+    """
+    :param: instances: (name, model file, proof file) triples
+    :return: for each instance the run with the smallest check time
+    """
+    results = []
+    for name, model_file, proof_file in instances:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(1) as pool:
+                runs.append(pool.submit(run_instance, name, model_file, proof_file).result())
+        best = min(runs, key=lambda result: result["check_seconds"])
+        print("%-24s check %8.3fs  parse %7.3fs  %10.0f steps/s  %8d KB" % (
+            name, best["check_seconds"], best["parse_seconds"], best["steps_per_second"] or 0,
+            best["peak_rss_kb"]))
+        results.append(best)
+    return results
+
+
+def compare(old: Dict, new: Dict, tolerance: float) -> List[str]:
+    """
+    :return: the instances whose check time grew by more than `tolerance` (e.g. 0.1 for 10%).
+    """
+    previous = {result["instance"]: result for result in old["results"]}
+    regressions = []
+    for result in new["results"]:
+        before = previous.get(result["instance"])
+        if before is None:
+            continue
+        ratio = result["check_seconds"] / before["check_seconds"]
+        print("%-24s %6.2fx check time" % (result["instance"], ratio))
+        if ratio > 1 + tolerance:
+            regressions.append(result["instance"])
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the PBProof checker on generated instances.")
+    parser.add_argument("--php", type=int, nargs="*", default=[4, 5, 6], help="numbers of holes")
+    parser.add_argument("--sudoku", type=int, nargs="*", default=[2, 3], help="box sizes")
+    parser.add_argument("--sudoku-holes", type=int, default=60, help="empty cells of the Sudoku puzzles")
+    parser.add_argument("--chain", type=int, nargs="*", default=[2000], help="lengths of implication chains")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per instance, the fastest is kept")
+    parser.add_argument("--out", default="bench_output.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown when comparing")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as directory:
+        instances = []
+        for holes in args.php:
+            instances += php_instances(directory, holes)
+        for box in args.sudoku:
+            instances += sudoku_instances(directory, box, args.sudoku_holes)
+        for length in args.chain:
+            instances += chain_instances(directory, length)
+        results = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": run(instances, args.repeat),
+        }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        if regressions:
+            print("REGRESSIONS: ", " ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+import argparse
+import sys
+import time
+
+from tokenizer import read_lines
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Write a proof to stdout line by line at a given pace, like a solver that logs it, e.g. "
+                    "`python -m benchmarks.replay proof.pbp | python pb_constraint.py model.opb - --follow`.")
+    parser.add_argument("proof_file")
+    parser.add_argument("--delay", type=float, default=0.001, help="seconds between lines")
+    parser.add_argument("--burst", type=int, default=1, help="lines written at a time")
+    args = parser.parse_args(argv)
+    output = sys.stdout.buffer
+    for line_no, _, line in read_lines(args.proof_file):
+        output.write(line + b"\n")
+        if line_no % args.burst == 0:
+            output.flush()
+            time.sleep(args.delay)
+    output.flush()
+
+
+if __name__ == '__main__':
+    main()
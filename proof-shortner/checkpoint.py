@@ -0,0 +1,105 @@
+import os
+import pickle
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional
+
+from tokenizer import Step
+
+MAGIC = b"PBS\x01"
+
+
+class Checkpointer:
+    """
+    Periodic snapshots of a running check, so that a check that dies can be continued with
+    `PBProof(..., resume=path)` instead of starting over. A snapshot holds the live constraint database and
+    the rest of the PBModel state (see `PBModel.snapshot`), the id counter and the position in the proof
+    file of the next step.
+
+    The state is pickled on the checking thread, which with the arena store is mostly copying its arrays;
+    writing, syncing and atomically renaming the file happen on a background thread. A snapshot that comes
+    due while the previous one is still being written is postponed to the next step, so checking never
+    waits for the disk.
+    """
+
+    def __init__(self, path: str, every: int = 0, seconds: float = 0.0):
+        """
+        :param: every: take a snapshot every this many steps, 0 for no step based snapshots
+        :param: seconds: take a snapshot every this many seconds, 0 for no time based snapshots
+        """
+        self.path = path
+        self.every = every
+        self.seconds = seconds
+        self.steps = 0  # steps admitted so far, including those before a resume
+        self.next = every
+        self.last = time.monotonic()
+        self.writer: Optional[threading.Thread] = None
+        self.written = 0
+        self.error: Optional[BaseException] = None
+
+    def run(self, proof, steps: Iterable[Step]) -> Iterator[Step]:
+        """
+        Passes `steps` through, taking a snapshot of `proof` before a step whenever one is due.
+        """
+        every = self.every
+        seconds = self.seconds
+        clock = time.monotonic
+        for step in steps:
+            if (every and self.steps >= self.next) or (seconds and clock() - self.last >= seconds):
+                self.save(proof, step)
+            yield step
+            self.steps += 1
+
+    def save(self, proof, step: Step) -> bool:
+        """
+        Snapshots the state of `proof` before `step`.
+        :return: False if the previous snapshot is still being written and this one is postponed.
+        """
+        if self.writer is not None and self.writer.is_alive():
+            return False
+        state = {
+            "position": proof.model.tokenizer.position(step, self.steps),
+            "line_no": step.line_no - 1,
+            "steps": self.steps,
+            "no_of_formulas": proof.no_of_formulas,
+            "contradiction": proof.contradiction,
+            "model": proof.model.snapshot(),
+        }
+        data = MAGIC + pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        self.writer = threading.Thread(target=self.write, args=(data,), daemon=True)
+        self.writer.start()
+        self.next = self.steps + self.every
+        self.last = time.monotonic()
+        return True
+
+    def write(self, data: bytes) -> None:
+        temporary = self.path + ".tmp"
+        try:
+            with open(temporary, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)  # a crash while writing leaves the previous snapshot intact
+            self.written += 1
+        except OSError as error:
+            self.error = error
+
+    def finish(self) -> None:
+        """
+        Waits for the snapshot being written, if any.
+        """
+        if self.writer is not None:
+            self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+    @staticmethod
+    def load(path: str) -> Dict:
+        """
+        :return: the state saved by `save`; snapshots are pickles and must come from a trusted source.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(path + " is not a checkpoint")
+        return pickle.loads(data[len(MAGIC):])
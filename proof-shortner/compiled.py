@@ -0,0 +1,353 @@
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from itertools import accumulate
+from typing import Iterator, List, Tuple
+
+from tokenizer import Step, Terms, Tokenizer
+
+MAGIC = b"PBC\x01"
+BLOCK_SIZE = 4096  # steps or model constraints per block
+TRAILER = struct.Struct("<QQQ")  # offset of the block index, number of model blocks, number of proof blocks
+KINDS = ("header", "f", "p", "u", "j", "e", "d", "c", "w", "#")  # step kind -> tag
+OPERATORS = ("+", "-", "*", "/", "s")  # stored as ~index among the numbers of a `p` step
+WIDTHS = ((1 << 7, "b"), (1 << 15, "h"), (1 << 31, "i"), (1 << 63, "q"))
+SIZES = {"b": 1, "h": 2, "i": 4, "q": 8}
+
+
+def zigzag(n: int) -> int:
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def unzigzag(z: int) -> int:
+    return (z >> 1) ^ -(z & 1)
+
+
+def deltas(values: List[int]) -> List[int]:
+    return [b - a for a, b in zip([0] + values, values)]
+
+
+class Block:
+    """
+    Up to BLOCK_SIZE steps (or model constraints) stored by column: one tag per step, the line numbers and
+    byte offsets in the text proof as deltas, the number of integer operands per step and all operands in
+    one flat column, and the constraints of `u`, `j` and `e` steps as their sizes, their literals and
+    coefficients one after the other, and their degrees. The header line is the only text.
+    """
+    COLUMNS = ("kinds", "lines", "offsets", "counts", "args", "sizes", "literals", "coefficients", "degrees")
+
+    def __init__(self):
+        for name in self.COLUMNS:
+            setattr(self, name, [])
+        self.texts: List[str] = []
+
+    def __len__(self) -> int:
+        return max(len(self.kinds), len(self.sizes))
+
+    def add_constraint(self, terms: Terms) -> None:
+        literals, coefficients, degree = terms
+        self.sizes.append(len(literals))
+        self.literals += literals
+        self.coefficients += coefficients
+        self.degrees.append(degree)
+
+    def add_step(self, step: Step) -> None:
+        kind = step.kind
+        self.kinds.append(KINDS.index(kind))
+        self.lines.append(step.line_no)
+        self.offsets.append(step.offset)
+        if kind == "header":
+            self.counts.append(0)
+            self.texts.append(step.args[0])
+            return
+        if kind == "p":
+            args = [~OPERATORS.index(token) if token in OPERATORS else int(token) for token in step.args]
+        else:
+            args = step.args
+        self.counts.append(len(args))
+        self.args += args
+        if step.constraint is not None:
+            self.add_constraint(step.constraint)
+
+
+class CompiledWriter:
+    """
+    Writes the binary form of a model and a proof. Counts are stored as varints; every column of a Block is
+    stored as a little-endian array of the smallest width that fits it, so that the reader turns a whole
+    column into a list in one call instead of decoding it number by number in Python. Columns with entries
+    beyond 64 bits fall back to zigzag varints.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray(MAGIC)
+        self.blocks = array("Q")  # file offsets of the blocks
+
+    def varint(self, n: int) -> None:
+        buffer = self.buffer
+        while n >= 0x80:
+            buffer.append((n & 0x7F) | 0x80)
+            n >>= 7
+        buffer.append(n)
+
+    def vector(self, values: List[int]) -> None:
+        self.varint(len(values))
+        bound = max((-v - 1 if v < 0 else v for v in values), default=0)
+        code = next((code for limit, code in WIDTHS if bound < limit), "v")
+        self.buffer.append(ord(code))
+        if code == "v":
+            for value in values:
+                self.varint(zigzag(value))
+        else:
+            packed = array(code, values)
+            if sys.byteorder != "little":
+                packed.byteswap()
+            self.buffer += packed.tobytes()
+
+    def block(self, block: Block) -> None:
+        self.blocks.append(len(self.buffer))
+        for name in Block.COLUMNS:
+            values = getattr(block, name)
+            self.vector(deltas(values) if name in ("lines", "offsets") else values)
+        self.varint(len(block.texts))
+        for text in block.texts:
+            encoded = text.encode()
+            self.varint(len(encoded))
+            self.buffer += encoded
+
+    def finish(self, no_of_model_blocks: int) -> bytes:
+        index_start = len(self.buffer)
+        if sys.byteorder != "little":
+            self.blocks.byteswap()
+        self.buffer += self.blocks.tobytes()
+        self.buffer += TRAILER.pack(index_start, no_of_model_blocks, len(self.blocks) - no_of_model_blocks)
+        return self.buffer
+
+
+def compile_proof(model_file: str, proof_file: str, output: str) -> int:
+    """
+    Compiles an OPB model and its VeriPB proof into one binary file that `CompiledTokenizer` reads back
+    without any text parsing. The steps keep the line numbers and byte offsets of the text proof, so
+    messages still point into it.
+
+    Layout: MAGIC, the numbers of variables, model constraints and steps as varints, the model blocks, the
+    proof blocks, the file offsets of all blocks as little-endian uint64 and the TRAILER.
+    :return: the size of the compiled file in bytes.
+    """
+    tokenizer = Tokenizer()
+    model_blocks = [Block()]
+    for terms in tokenizer.model(model_file):
+        if len(model_blocks[-1]) == BLOCK_SIZE:
+            model_blocks.append(Block())
+        model_blocks[-1].add_constraint(terms)
+    proof_blocks = [Block()]
+    for step in tokenizer.proof(proof_file):
+        if len(proof_blocks[-1]) == BLOCK_SIZE:
+            proof_blocks.append(Block())
+        proof_blocks[-1].add_step(step)
+    writer = CompiledWriter()
+    writer.varint(tokenizer.no_of_variables)
+    writer.varint(sum(len(block) for block in model_blocks))
+    writer.varint(sum(len(block) for block in proof_blocks))
+    for block in model_blocks + proof_blocks:
+        writer.block(block)
+    data = writer.finish(len(model_blocks))
+    with open(output, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def is_compiled(filename) -> bool:
+    if not isinstance(filename, (str, os.PathLike)):
+        return False
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class CompiledFile:
+    """
+    Read access to a compiled proof through `mmap`: the model constraints in order and the steps from any
+    position on, one block at a time.
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(str(filename) + " is not a compiled proof")
+        index_start, self.no_of_model_blocks, no_of_proof_blocks = TRAILER.unpack_from(
+            self.map, len(self.map) - TRAILER.size)
+        self.blocks = array("Q", self.map[index_start:index_start + 8 * (self.no_of_model_blocks + no_of_proof_blocks)])
+        if sys.byteorder != "little":
+            self.blocks.byteswap()
+        self.no_of_variables, k = self.varint(len(MAGIC))
+        self.no_of_constraints, k = self.varint(k)
+        self.no_of_steps, k = self.varint(k)
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self) -> "CompiledFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def varint(self, k: int) -> Tuple[int, int]:
+        """
+        :return: the varint at offset k and the offset after it
+        """
+        data = self.map
+        n = 0
+        shift = 0
+        while True:
+            b = data[k]
+            k += 1
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                return n, k
+            shift += 7
+
+    def vector(self, k: int) -> Tuple[List[int], int]:
+        """
+        :return: the column at offset k and the offset after it
+        """
+        n, k = self.varint(k)
+        code = chr(self.map[k])
+        k += 1
+        if code == "v":
+            values = []
+            for _ in range(n):
+                z, k = self.varint(k)
+                values.append(unzigzag(z))
+            return values, k
+        end = k + n * SIZES[code]
+        values = array(code, self.map[k:end])
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values.tolist(), end
+
+    def block(self, number: int) -> Block:
+        block = Block()
+        k = self.blocks[number]
+        for name in Block.COLUMNS:
+            values, k = self.vector(k)
+            setattr(block, name, list(accumulate(values)) if name in ("lines", "offsets") else values)
+        n, k = self.varint(k)
+        for _ in range(n):
+            length, k = self.varint(k)
+            block.texts.append(self.map[k:k + length].decode())
+            k += length
+        return block
+
+    def model(self) -> Iterator[Terms]:
+        for number in range(self.no_of_model_blocks):
+            block = self.block(number)
+            literals = block.literals
+            coefficients = block.coefficients
+            start = 0
+            for size, degree in zip(block.sizes, block.degrees):
+                end = start + size
+                yield literals[start:end], coefficients[start:end], degree
+                start = end
+
+    def proof(self, first: int = 0) -> Iterator[Step]:
+        """
+        :param: first: the index of the first step to read
+        """
+        kinds = KINDS
+        for number in range(self.no_of_model_blocks + first // BLOCK_SIZE, len(self.blocks)):
+            block = self.block(number)
+            args = block.args
+            literals = block.literals
+            coefficients = block.coefficients
+            sizes = iter(block.sizes)
+            degrees = iter(block.degrees)
+            texts = iter(block.texts)
+            a = 0
+            b = 0
+            skip = first % BLOCK_SIZE if number == self.no_of_model_blocks + first // BLOCK_SIZE else 0
+            for position, (tag, line_no, offset, count) in enumerate(
+                    zip(block.kinds, block.lines, block.offsets, block.counts)):
+                kind = kinds[tag]
+                operands = tuple(args[a:a + count])
+                a += count
+                constraint = None
+                if kind == "p":
+                    operands = tuple(token if token >= 0 else OPERATORS[~token] for token in operands)
+                elif kind == "u" or kind == "j" or kind == "e":
+                    size = next(sizes)
+                    constraint = (literals[b:b + size], coefficients[b:b + size], next(degrees))
+                    b += size
+                elif kind == "header":
+                    operands = (next(texts),)
+                if position >= skip:
+                    yield Step(kind, line_no, offset, operands, constraint)
+
+
+class CompiledTokenizer(Tokenizer):
+    """
+    Stands in for the Tokenizer of a PBModel whose model file is compiled: `model` and `proof` read the
+    compiled file instead of parsing text. The numbers of a `p` step come as ints rather than strings.
+    """
+
+    def model(self, file) -> Iterator[Terms]:
+        with CompiledFile(file) as compiled:
+            self.no_of_variables = max(self.no_of_variables, compiled.no_of_variables)
+            yield from compiled.model()
+
+    def proof(self, file, start: int = 0, line_no: int = 0) -> Iterator[Step]:
+        """
+        :param: start: the index of the first step, not a byte offset as for text proofs
+        :param: line_no: unused, the steps know their line numbers
+        """
+        with CompiledFile(file) as compiled:
+            yield from compiled.proof(start)
+
+    def position(self, step: Step, index: int) -> int:
+        return index
+
+
+def benchmark(model_file: str, proof_file: str, repeat: int = 3) -> dict:
+    """
+    Compares the text and the compiled form of a proof: their sizes on disk and the best time over `repeat`
+    runs to read all model constraints and steps.
+    """
+    output = proof_file + ".pbc"
+    compiled_bytes = compile_proof(model_file, proof_file, output)
+
+    def best(tokenizer_class, model, proof) -> float:
+        seconds = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            tokenizer = tokenizer_class()
+            for _ in tokenizer.model(model):
+                pass
+            for _ in tokenizer.proof(proof):
+                pass
+            seconds = min(seconds, time.perf_counter() - start)
+        return seconds
+
+    try:
+        return {"text_bytes": os.path.getsize(model_file) + os.path.getsize(proof_file),
+                "compiled_bytes": compiled_bytes,
+                "text_seconds": best(Tokenizer, model_file, proof_file),
+                "compiled_seconds": best(CompiledTokenizer, output, output)}
+    finally:
+        os.remove(output)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5 and sys.argv[1] == "compile":
+        print("%d bytes" % compile_proof(sys.argv[2], sys.argv[3], sys.argv[4]))
+    elif len(sys.argv) == 4 and sys.argv[1] == "bench":
+        result = benchmark(sys.argv[2], sys.argv[3])
+        print("text      %10d bytes %8.3fs" % (result["text_bytes"], result["text_seconds"]))
+        print("compiled  %10d bytes %8.3fs" % (result["compiled_bytes"], result["compiled_seconds"]))
+    else:
+        print('Usage: %s compile model_file proof_file output.pbc | bench model_file proof_file' % sys.argv[0])
+        sys.exit(1)
@@ -1,5 +1,9 @@
-from typing import Tuple, Iterable
-from collections import deque
+import heapq
+from array import array
+from typing import Dict, Iterable, List, Tuple
+from collections import defaultdict, deque
+
+from trail import Trail
 
 
 class Constraint:
@@ -11,76 +15,59 @@ class Constraint:
         """
         Performs partial assignment of this clause with give `assignment` and returns the resulting list of literals,
         i.e. if the clause is SAT then returns empty list, otherwise returns the remaining list of unassigned literals.
-        :param assignment: the assignment
+        :param assignment: the true literals, a Trail or a set so that membership tests are O(1)
         :return: if the clause is SAT then returns empty list, otherwise returns the remaining list of unassigned
         literals
         """
-        unassigned = set(self.literals)  # set has O(1) remove complexity
-        for literal in assignment:
-            if literal in self.literals:
+        unassigned = []
+        for literal in self.literals:
+            if literal in assignment:
                 return []
-
-            if -literal in self.literals:
-                unassigned.remove(-literal)
-
-        return list(unassigned)
+            if -literal not in assignment:
+                unassigned.append(literal)
+        return unassigned
 
     def is_satisfied(self, assignment: Iterable) -> bool:
         """
-        :param: assignment: the assignment
+        :param: assignment: the true literals, a Trail or a set
         :return: True if the clause is satisfied in the `assignment`, i.e. one of its literals is True.
         """
-        for literal in assignment:
-            if literal in self.literals:
+        for literal in self.literals:
+            if literal in assignment:
                 return True
         return False
 
     def is_unsatisfied(self, assignment: Iterable) -> bool:
         """
-        :param: assignment: the assignment
+        :param: assignment: the true literals, a Trail or a set
         :return: True if the clause is unsatisfied in the `assignment`, i.e. all of the literals are False.
         """
-        false = 0
-        for literal in assignment:
-            if literal in self.literals:
+        for literal in self.literals:
+            if -literal not in assignment:
                 return False
-
-            if -literal in self.literals:
-                false += 1
-        return false == self.size
+        return True
 
     def is_unit(self, assignment: Iterable) -> bool:
         """
-        :param: assignment: the assignment
+        :param: assignment: the true literals, a Trail or a set
         :return: True if the clause is unit in the `assignment`, i.e. only one literal is unassigned and the rest of
         them are False.
         """
-        false = 0
-        for literal in assignment:
-            if literal in self.literals:
-                return False
+        return self.unit(assignment) is not None
 
-            if -literal in self.literals:
-                false += 1
-
-        return false == self.size - 1
     def unit(self, assignment: Iterable) -> int:
         """
-        :param: assignment: the assignment
+        :param: assignment: the true literals, a Trail or a set
         :return: the unit literal if the clause is unit in the `assignment`, otherwise returns None.
         """
-        false = 0
-        for literal in assignment:
-            if literal in self.literals:
+        unit = None
+        for literal in self.literals:
+            if -literal in assignment:
+                continue
+            if unit is not None or literal in assignment:
                 return None
-
-            if -literal in self.literals:
-                false += 1
-
-        if false == self.size - 1:
-            unit = iter(self.literals - set([-i for i in assignment]))
-            return next(unit)
-        return None
+            unit = literal
+        return unit
 
 
 class PBModel:
@@ -93,23 +80,22 @@ class PBModel:
         self.unassigned = set()  # unordered unique set of unsigned variables in the formula (clauses use literals)
         self.adjacency_lists = {}  # dictionary with variables as keys and values as lists of clauses with this literal
         self.unit_clauses_queue = deque()  # queue for unit clauses
-        self.assignment_stack = deque()  # stack for representing the current assignment for backtracking
+        self.assignment_stack = Trail()  # stack for representing the current assignment for backtracking
 
         for clause in self.clauses:
             if clause.is_unit([]):
                 self.unit_clauses_queue.append(clause)
 
-            # For every literal in clause (*)
-            for literal in clause.literals:
-                variable = abs(literal)
+            # For every variable in clause (*); a variable occurs twice in a clause only if the clause is a tautology,
+            # so going over the set of variables adds the clause once without searching the list.
+            for variable in {abs(literal) for literal in clause.literals}:
                 self.unassigned.add(variable)
 
                 # (*) find out if it already has list of clauses (key) in adjacency_lists. If it does, then update that
                 # list with this clause. If it does not, then create new element of dictionary `adjacency_lists` with
                 # key being this variable and then create its value as a list with this clause.
                 if variable in self.adjacency_lists:
-                    if clause not in self.adjacency_lists[variable]:
-                        self.adjacency_lists[variable].append(clause)
+                    self.adjacency_lists[variable].append(clause)
 
                 else:
                     self.adjacency_lists[variable] = [clause]
@@ -135,7 +121,7 @@ class PBModel:
         for literal in assignment:
             # Remove corresponding variable from the unassigned set of the formula and add literal to assignment stack
             self.unassigned.remove(abs(literal))
-            self.assignment_stack.append(literal)
+            self.assignment_stack.assign(literal)
 
             # For every clause in the adjacency list of this variable find out which
             # clauses become unit and which become unsatisfied in the current assignment
@@ -155,11 +141,11 @@ class PBModel:
         :param decision_literal: the last literal which assignment is undone
         """
         self.unit_clauses_queue.clear()
-        while self.assignment_stack:
-            literal = self.assignment_stack.pop()
+        trail = self.assignment_stack
+        position = trail.positions[decision_literal] if decision_literal in trail else 0
+        for literal in trail.literals[position:]:
             self.unassigned.add(abs(literal))
-            if literal == decision_literal:
-                break
+        trail.truncate(position)
 
     def unit_propagation(self) -> Tuple[list, bool]:
         """
@@ -231,6 +217,331 @@ class PBModel:
                 print(clause.literals)
 
 
+def luby(i: int) -> int:
+    """
+    :return: the i-th element (from 1) of the Luby sequence 1 1 2 1 1 2 4 1 1 2 ...
+    """
+    size, exponent = 1, 0
+    while size < i + 1:
+        size, exponent = 2 * size + 1, exponent + 1
+    while size - 1 != i:
+        size = (size - 1) // 2
+        exponent -= 1
+        i %= size
+    return 1 << exponent
+
+
+class CDCLSolver(PBModel):
+    """
+    A conflict driven clause learning solver on top of PBModel: two watched literals over the Trail, 1UIP
+    learning, EVSIDS with a lazy binary heap, phase saving, Luby restarts and periodic removal of the learnt
+    clauses with the highest LBD.
+
+    If `proof_file` is given the run is logged as a VeriPB proof of the formula written by `write_opb`: every
+    learnt clause becomes a `u` step and every removed one a `d` step, so `PBProof` can check the refutation.
+    """
+
+    def __init__(self, formula, proof_file=None, restart_interval: int = 100, reduce_interval: int = 2000):
+        super().__init__(formula)
+        self.no_of_variables = max((abs(literal) for clause in formula for literal in clause), default=0)
+        n = self.no_of_variables
+        self.assignment_stack.ensure(n)
+        self.clause_literals: List[List[int]] = []  # clause index -> literals, the first two are watched
+        self.ids: List[int] = []  # clause index -> constraint id in the proof
+        self.lbds: List[int] = []  # clause index -> literal block distance, 0 for formula clauses
+        self.deleted = bytearray()
+        self.watches: Dict[int, List[int]] = defaultdict(list)  # literal -> indices of clauses watching it
+        self.units: List[int] = []  # indices of unit clauses of the formula
+        self.empty = False  # the formula contains the empty clause
+        self.levels = array("i", bytes(4 * (n + 1)))  # variable -> decision level of its assignment
+        self.reasons = array("i", [-1] * (n + 1))  # variable -> index of the clause that propagated it
+        self.activity = [0.0] * (n + 1)
+        self.increment = 1.0
+        self.decay = 0.95
+        self.heap = [(0.0, variable) for variable in range(1, n + 1)]  # (-activity, variable), may be stale
+        self.phases = bytearray(n + 1)  # variable -> 1 if it was last assigned true
+        self.head = 0
+        self.restart_interval = restart_interval
+        self.reduce_interval = reduce_interval
+        self.conflicts = 0
+        self.decisions = 0
+        self.solution: List[int] = []
+        self.next_id = len(formula)
+        self.proof = open(proof_file, "w") if proof_file else None
+        for literals in formula:
+            self.attach(list(dict.fromkeys(literals)))
+
+    def attach(self, literals: List[int], lbd: int = 0) -> int:
+        """
+        Adds a clause, a learnt one once all formula clauses have been added.
+        :return: its index
+        """
+        index = len(self.clause_literals)
+        learnt = index >= len(self.formula)
+        if learnt:
+            self.next_id += 1
+        self.ids.append(self.next_id if learnt else index + 1)
+        self.clause_literals.append(literals)
+        self.lbds.append(lbd)
+        self.deleted.append(0)
+        if len(literals) >= 2:
+            self.watches[literals[0]].append(index)
+            self.watches[literals[1]].append(index)
+        elif not learnt:
+            if literals:
+                self.units.append(index)
+            else:
+                self.empty = True
+        return index
+
+    def log(self, line: str) -> None:
+        if self.proof is not None:
+            self.proof.write(line + "\n")
+
+    @staticmethod
+    def veripb_clause(literals: Iterable) -> str:
+        return " ".join(("1 x%d" % literal) if literal > 0 else ("1 ~x%d" % -literal) for literal in literals) + \
+            " >= 1 ;"
+
+    def write_opb(self, filename) -> None:
+        """
+        Writes the formula as an OPB file whose constraint ids match the ones used in the proof.
+        """
+        with open(filename, "w") as f:
+            f.write("* #variable= %d #constraint= %d\n" % (self.no_of_variables, len(self.formula)))
+            for literals in self.formula:
+                f.write(" ".join(("1 x%d" % literal) if literal > 0 else ("1 ~x%d" % -literal)
+                                 for literal in literals) + " >= 1 ;\n")
+
+    def enqueue(self, literal: int, reason: int) -> None:
+        trail = self.assignment_stack
+        trail.assign(literal)
+        variable = literal if literal > 0 else -literal
+        self.levels[variable] = trail.level
+        self.reasons[variable] = reason
+
+    def propagate(self):
+        """
+        :return: the index of a falsified clause, None if propagation ends without a conflict.
+        """
+        trail = self.assignment_stack
+        values = trail.values
+        literals = trail.literals
+        clauses, deleted, watches = self.clause_literals, self.deleted, self.watches
+        while self.head < len(literals):
+            false_literal = -literals[self.head]
+            self.head += 1
+            watchers = watches[false_literal]
+            i = 0
+            while i < len(watchers):
+                index = watchers[i]
+                if deleted[index]:
+                    watchers[i] = watchers[-1]
+                    watchers.pop()
+                    continue
+                clause = clauses[index]
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], clause[0]
+                first = clause[0]
+                if values[first]:
+                    i += 1
+                    continue
+                for k in range(2, len(clause)):
+                    literal = clause[k]
+                    if not values[-literal]:
+                        clause[1], clause[k] = literal, false_literal
+                        watches[literal].append(index)
+                        watchers[i] = watchers[-1]
+                        watchers.pop()
+                        break
+                else:
+                    if values[-first]:
+                        return index
+                    self.enqueue(first, index)
+                    i += 1
+        return None
+
+    def bump(self, variable: int) -> None:
+        activity = self.activity
+        activity[variable] += self.increment
+        if activity[variable] > 1e100:
+            for v in range(1, len(activity)):
+                activity[v] *= 1e-100
+            self.increment *= 1e-100
+            self.rebuild_heap()
+        elif variable not in self.assignment_stack and -variable not in self.assignment_stack:
+            heapq.heappush(self.heap, (-activity[variable], variable))
+
+    def rebuild_heap(self) -> None:
+        trail = self.assignment_stack
+        self.heap = [(-self.activity[v], v) for v in range(1, self.no_of_variables + 1)
+                     if v not in trail and -v not in trail]
+        heapq.heapify(self.heap)
+
+    def analyze(self, conflict: int) -> Tuple[List[int], int, int]:
+        """
+        Resolves the falsified clause with the reasons of its literals of the current level until a single one is
+        left, the first unique implication point.
+        :return: the learnt clause, asserting literal first, the level to jump back to and its LBD
+        """
+        trail = self.assignment_stack
+        levels, reasons = self.levels, self.reasons
+        level = trail.level
+        seen = set()
+        learnt = [0]
+        pending = 0  # literals of the current level yet to be resolved
+        index = len(trail.literals) - 1
+        clause = self.clause_literals[conflict]
+        literal = None
+        while True:
+            for other in clause:
+                if other == literal:
+                    continue
+                variable = abs(other)
+                if variable not in seen and levels[variable] > 0:
+                    seen.add(variable)
+                    self.bump(variable)
+                    if levels[variable] == level:
+                        pending += 1
+                    else:
+                        learnt.append(other)
+            while abs(trail.literals[index]) not in seen:
+                index -= 1
+            literal = trail.literals[index]
+            index -= 1
+            pending -= 1
+            if pending == 0:
+                break
+            clause = self.clause_literals[reasons[abs(literal)]]
+        learnt[0] = -literal
+        backjump = 0
+        if len(learnt) > 1:
+            k = max(range(1, len(learnt)), key=lambda j: levels[abs(learnt[j])])
+            learnt[1], learnt[k] = learnt[k], learnt[1]
+            backjump = levels[abs(learnt[1])]
+        lbd = len({levels[abs(other)] for other in learnt})
+        return learnt, backjump, lbd
+
+    def backjump(self, level: int) -> None:
+        trail = self.assignment_stack
+        if level >= trail.level:
+            return
+        activity, phases = self.activity, self.phases
+        for literal in trail.literals[trail.marks[level]:]:
+            variable = abs(literal)
+            phases[variable] = literal > 0
+            heapq.heappush(self.heap, (-activity[variable], variable))
+        trail.backtrack(level)
+        self.head = len(trail)
+
+    def decide(self):
+        """
+        :return: the unassigned variable of highest activity with its saved phase, None if all are assigned.
+        """
+        trail = self.assignment_stack
+        heap = self.heap
+        if len(heap) > 4 * self.no_of_variables + 100:
+            self.rebuild_heap()
+            heap = self.heap
+        while heap:
+            _, variable = heapq.heappop(heap)
+            if variable not in trail and -variable not in trail:
+                return variable if self.phases[variable] else -variable
+        return None
+
+    def reduce(self) -> None:
+        """
+        Deletes the worse half of the learnt clauses by LBD, keeping glue clauses and those that are reasons.
+        """
+        trail = self.assignment_stack
+        candidates = []
+        for index in range(len(self.formula), len(self.clause_literals)):
+            literals = self.clause_literals[index]
+            if self.deleted[index] or self.lbds[index] <= 2 or len(literals) < 2:
+                continue
+            first = literals[0]
+            if first in trail and self.reasons[abs(first)] == index:
+                continue
+            candidates.append(index)
+        candidates.sort(key=lambda index: -self.lbds[index])
+        removed = candidates[:len(candidates) // 2]
+        for index in removed:
+            self.deleted[index] = 1
+        if removed:
+            self.log("d " + " ".join(str(self.ids[index]) for index in removed) + " 0")
+
+    def refuted(self) -> bool:
+        self.next_id += 1
+        self.log("u >= 1 ;")
+        self.log("c %d 0" % self.next_id)
+        return False
+
+    def solve(self) -> bool:
+        """
+        :return: True and the true literals in `solution` if the formula is satisfiable, False otherwise.
+        """
+        self.log("pseudo-Boolean proof version 1.0")
+        self.log("f %d 0" % len(self.formula))
+        try:
+            return self.search()
+        finally:
+            if self.proof is not None:
+                self.proof.close()
+
+    def search(self) -> bool:
+        trail = self.assignment_stack
+        if self.empty:
+            return self.refuted()
+        for index in self.units:
+            literal = self.clause_literals[index][0]
+            if -literal in trail:
+                return self.refuted()
+            if literal not in trail:
+                self.enqueue(literal, index)
+        restarts = 1
+        restart_limit = self.restart_interval * luby(restarts)
+        since_restart = 0
+        next_reduce = self.reduce_interval
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                since_restart += 1
+                if trail.level == 0:
+                    return self.refuted()
+                learnt, level, lbd = self.analyze(conflict)
+                self.backjump(level)
+                index = self.attach(learnt, lbd)
+                self.log("u " + self.veripb_clause(learnt))
+                self.enqueue(learnt[0], index)
+                self.increment /= self.decay
+                continue
+            if since_restart >= restart_limit:
+                restarts += 1
+                restart_limit = self.restart_interval * luby(restarts)
+                since_restart = 0
+                self.backjump(0)
+            if self.conflicts >= next_reduce:
+                next_reduce += self.reduce_interval + 300 * (next_reduce // self.reduce_interval)
+                self.reduce()
+            literal = self.decide()
+            if literal is None:
+                self.solution = list(trail)
+                return True
+            self.decisions += 1
+            trail.new_level()
+            self.enqueue(literal, -1)
+
+
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 3:
+        # python constraint.py formula.cnf model.opb proof.pbp, then check with PBProof(model.opb, proof.pbp)
+        from rup import read_dimacs
+        solver = CDCLSolver(read_dimacs(sys.argv[1]), sys.argv[3])
+        solver.write_opb(sys.argv[2])
+        print("SATISFIABLE" if solver.solve() else "UNSATISFIABLE", "--", solver.conflicts, "conflicts,",
+              solver.decisions, "decisions")
+        sys.exit(0)
     model = PBModel([[8, 9, 2, 3],[8, 9, -2, 3], [8, 9, 4, -3], [8, 9, -4, -3]])
     model.print()
\ No newline at end of file
@@ -0,0 +1,226 @@
+from typing import Iterable, List, Tuple
+
+
+class Accumulator:
+    """
+    Dense linear form sum(a_v * x_v) >= degree indexed by variable, with signed coefficients, i.e. a term
+    c ~x is kept as -c x and a degree shift of -c. Opposite literals therefore cancel on their own and the
+    positive-coefficient normal form is only computed once, when the result is read out. Only the touched
+    variables are visited and reset, so one accumulator can be reused across steps.
+    """
+
+    def __init__(self):
+        self.coefficients: List[int] = [0]
+        self.marked = bytearray(1)
+        self.touched: List[int] = []
+        self.degree = 0
+
+    def add_terms(self, terms: Iterable[Tuple[int, int]], degree: int, factor: int = 1) -> None:
+        """
+        Adds `factor` times the constraint given by its (literal, coefficient) `terms` and `degree`.
+        """
+        coefficients = self.coefficients
+        marked = self.marked
+        shift = 0
+        for literal, coefficient in terms:
+            variable = literal if literal > 0 else -literal
+            if variable >= len(coefficients):
+                grow = variable + 1 - len(coefficients)
+                coefficients.extend([0] * grow)
+                marked.extend(bytes(grow))
+            if not marked[variable]:
+                marked[variable] = 1
+                self.touched.append(variable)
+            if literal > 0:
+                coefficients[variable] += coefficient * factor
+            else:
+                coefficients[variable] -= coefficient * factor
+                shift += coefficient
+        self.degree += (degree - shift) * factor
+
+    def add_accumulator(self, other: "Accumulator", factor: int = 1) -> None:
+        """
+        Adds `factor` times the linear form held by `other`.
+        """
+        other_coefficients = other.coefficients
+        self.add_terms(((v, other_coefficients[v]) for v in other.touched), other.degree, factor)
+
+    def multiply(self, constant: int) -> None:
+        if constant <= 0:
+            raise ValueError("can only multiply by a positive constant")
+        coefficients = self.coefficients
+        for v in self.touched:
+            coefficients[v] *= constant
+        self.degree *= constant
+
+    def divide(self, constant: int) -> None:
+        """
+        Divides the normalized form by `constant`, rounding coefficients and degree up.
+        """
+        if constant <= 0:
+            raise ValueError("can only divide by a positive constant")
+        self.map_normalized(lambda coefficient, degree: -(-coefficient // constant), lambda degree: -(-degree // constant))
+
+    def saturate(self) -> None:
+        """
+        Caps every coefficient of the normalized form at its degree.
+        """
+        self.map_normalized(lambda coefficient, degree: min(coefficient, degree) if degree > 0 else coefficient,
+                            lambda degree: degree)
+
+    def map_normalized(self, coefficient_map, degree_map) -> None:
+        """
+        Rewrites the normalized form b_v l_v >= N into coefficient_map(b_v, N) l_v >= degree_map(N), keeping
+        the signed representation.
+        """
+        coefficients = self.coefficients
+        normalized_degree = self.degree
+        for v in self.touched:
+            if coefficients[v] < 0:
+                normalized_degree -= coefficients[v]
+        new_degree = degree_map(normalized_degree)
+        for v in self.touched:
+            coefficient = coefficients[v]
+            if coefficient > 0:
+                coefficients[v] = coefficient_map(coefficient, normalized_degree)
+            elif coefficient < 0:
+                coefficient = coefficient_map(-coefficient, normalized_degree)
+                coefficients[v] = -coefficient
+                new_degree -= coefficient
+        self.degree = new_degree
+
+    def result(self) -> Tuple[List[int], List[int], int]:
+        """
+        Reads out the normalized form and clears the accumulator.
+        :return: the literals, the (positive) coefficients and the degree.
+        """
+        coefficients = self.coefficients
+        literals = []
+        normalized = []
+        degree = self.degree
+        for v in self.touched:
+            coefficient = coefficients[v]
+            if coefficient > 0:
+                literals.append(v)
+                normalized.append(coefficient)
+            elif coefficient < 0:
+                literals.append(-v)
+                normalized.append(-coefficient)
+                degree -= coefficient
+        self.clear()
+        return literals, normalized, degree
+
+    def clear(self) -> None:
+        coefficients = self.coefficients
+        marked = self.marked
+        for v in self.touched:
+            coefficients[v] = 0
+            marked[v] = 0
+        self.touched.clear()
+        self.degree = 0
+
+
+class PolEvaluator:
+    """
+    Evaluates the reverse polish notation of a `p` step by folding it into accumulators. Operands are read
+    from the constraint database in place and never copied; the result is normalized once at the end.
+
+    With `saturate` set every sum and the result are saturated, which keeps coefficients from growing over
+    long derivations. A saturated constraint is equivalent to the unsaturated one, but the constraints
+    derived from it can differ from VeriPB's, so it is off by default. Statements that subtract are only
+    saturated at the end, since subtracting a saturated constraint gives a weaker result.
+    """
+    operations = {"+", "-", "*", "/", "s"}
+
+    def __init__(self, constraint_db, saturate: bool = False):
+        self.constraint_db = constraint_db
+        self.saturate = saturate
+        self.pool: List[Accumulator] = []
+
+    @staticmethod
+    def operand_ids(statement: List[str]) -> List[int]:
+        """
+        :return: the ids of the constraints an RPN statement refers to, leaving out constants and operators.
+        """
+        ids = []
+        for k, token in enumerate(statement):
+            if token not in PolEvaluator.operations and not (k + 1 < len(statement) and statement[k + 1] in ("*", "/")):
+                ids.append(int(token))
+        return ids
+
+    def acquire(self) -> Accumulator:
+        return self.pool.pop() if self.pool else Accumulator()
+
+    def release(self, accumulator: Accumulator) -> None:
+        accumulator.clear()
+        self.pool.append(accumulator)
+
+    def load(self, operand) -> Accumulator:
+        """
+        :param: operand: a constraint id or an accumulator
+        :return: an accumulator holding the operand
+        """
+        if isinstance(operand, Accumulator):
+            return operand
+        accumulator = self.acquire()
+        constraint = self.constraint_db[operand]
+        accumulator.add_terms(constraint.terms(), constraint.degree)
+        return accumulator
+
+    def fold(self, accumulator: Accumulator, operand, factor: int = 1) -> None:
+        """
+        Adds `factor` times `operand` to `accumulator`.
+        """
+        if isinstance(operand, Accumulator):
+            accumulator.add_accumulator(operand, factor)
+            self.release(operand)
+        else:
+            constraint = self.constraint_db[operand]
+            accumulator.add_terms(constraint.terms(), constraint.degree, factor)
+
+    def evaluate(self, statement: List[str]) -> Tuple[List[int], List[int], int]:
+        """
+        :param: statement: the tokens of the step after `p`, e.g. ["31", "62", "+", "2", "*"]; numbers may be ints
+        :return: the literals, coefficients and degree of the derived constraint in normalized form.
+        """
+        stack = []
+        saturate = self.saturate and "-" not in statement
+        for k, token in enumerate(statement):
+            if token not in self.operations:
+                if k + 1 < len(statement) and statement[k + 1] in ("*", "/"):
+                    continue  # a constant, consumed by the operator
+                stack.append(int(token))
+            elif token == "+":
+                a = stack.pop()
+                b = stack.pop()
+                if isinstance(b, Accumulator) and not isinstance(a, Accumulator):
+                    a, b = b, a
+                accumulator = self.load(a)
+                self.fold(accumulator, b)
+                if saturate:
+                    accumulator.saturate()
+                stack.append(accumulator)
+            elif token == "-":
+                # the top of the stack minus the one below it
+                a = stack.pop()
+                b = stack.pop()
+                accumulator = self.load(a)
+                self.fold(accumulator, b, -1)
+                stack.append(accumulator)
+            else:
+                accumulator = self.load(stack.pop())
+                if token == "*":
+                    accumulator.multiply(int(statement[k - 1]))
+                elif token == "/":
+                    accumulator.divide(int(statement[k - 1]))
+                else:
+                    accumulator.saturate()
+                stack.append(accumulator)
+        if len(stack) != 1:
+            raise Exception("malformed pol step: " + " ".join(map(str, statement)))
+        accumulator = self.load(stack.pop())
+        if self.saturate:
+            accumulator.saturate()
+        result = accumulator.result()
+        self.pool.append(accumulator)
+        return result
@@ -0,0 +1,159 @@
+import os
+import sys
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List
+
+from pb_constraint import ConstraintStore, PBConstraint, PBModel, PBProof
+from propagator import Propagator
+from tracer import INFO, Tracer
+
+ALIVE = 1 << 62  # death time of constraints that are never deleted
+
+
+class RecordingModel(PBModel):
+    """
+    A PBModel for the sequential pass of the parallel checker. It derives every constraint but does not
+    verify RUP steps; it records them as obligations instead. Deleted constraints stay in the arena and only
+    get a death time, the last id derived while they were alive, so any step can later be checked against
+    exactly the constraints that were live when it was derived.
+    """
+
+    def __init__(self, filename, record_dependencies: bool = False, tracer: Tracer = None, batch_slack: bool = False,
+                 vectorized: bool = None, lazy: bool = False):
+        self.deaths = array("q", [ALIVE])  # indexed by constraint id
+        self.obligations: List[int] = []  # ids of the constraints derived by RUP steps
+        self.live = 0
+        # every constraint has to go through `add_constraint` to get its death time, so never lazy
+        super().__init__(filename, record_dependencies, tracer, batch_slack, vectorized, False)
+
+    def add_constraint(self, constraint: PBConstraint, antecedents: Iterable[int] = ()):
+        cid = self.new_id(constraint.coefficients.values(), constraint.degree, antecedents)
+        self.constraint_db[cid] = constraint
+        self.deaths.append(ALIVE)
+        self.live += 1
+        self.added(cid, constraint)
+
+    def no_of_live(self) -> int:
+        return self.live
+
+    def is_live(self, cid: int) -> bool:
+        return cid in self.constraint_db and self.deaths[cid] == ALIVE
+
+    def delete_constraint(self, cid: int) -> None:
+        if not self.is_live(cid):
+            raise Exception("cannot delete constraint " + str(cid) + ": not in the database")
+        self.deaths[cid] = self.no_of_constraints
+        self.live -= 1
+        if self.tracer.veripb:
+            self.tracer.deleted.append(cid)
+
+    def admit_rup_step(self, constraint: PBConstraint, hints: Iterable[int] = ()) -> None:
+        self.obligations.append(self.no_of_constraints + 1)
+        self.add_constraint(constraint)
+
+
+# state of a worker process, set up by `attach`
+_shared: List[shared_memory.SharedMemory] = []
+_store = None
+_deaths = None
+
+
+def attach(layout: Dict[str, tuple], overflow: Dict[int, PBConstraint]) -> None:
+    """
+    Maps the arena and death times published by the parent into this worker.
+    :param: layout: buffer name -> (shared memory name, typecode, number of items)
+    """
+    global _store, _deaths
+    buffers = {}
+    for name, (shm_name, typecode, length) in layout.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shared.append(shm)
+        buffers[name] = shm.buf.cast(typecode)[:length]
+    _deaths = buffers.pop("deaths")
+    _store = ConstraintStore.from_buffers(buffers, overflow)
+
+
+def check_obligations(ids: List[int]) -> List[int]:
+    """
+    Checks a sorted run of RUP obligations, replaying the additions and deletions between them on one
+    incremental propagator.
+    :return: the ids whose RUP check failed.
+    """
+    store, deaths = _store, _deaths
+    first, last = ids[0], ids[-1]
+    dying = defaultdict(list)  # death time -> ids
+    propagator = Propagator()
+    for cid in range(1, len(deaths)):
+        death = deaths[cid]
+        if cid < first and death >= first:
+            propagator.add(cid, store[cid])
+        if first <= death < last:
+            dying[death].append(cid)
+    failed = []
+    current = first
+    for t in ids:
+        for cid in range(current, t):
+            propagator.add(cid, store[cid])
+        for time in range(current, t):
+            for cid in dying.pop(time, ()):
+                propagator.remove(cid)
+        current = t
+        negation = store[t].copy()
+        negation.negation()
+        if not propagator.check(negation):
+            failed.append(t)
+    return failed
+
+
+class ParallelProof(PBProof):
+    """
+    Checks a proof in two phases. A sequential pass derives all constraints and ids without verifying RUP
+    steps. The RUP obligations are then split into contiguous runs and checked by a process pool; the
+    workers read the constraint arena from shared memory instead of receiving copies of it.
+    """
+    model_class = RecordingModel
+
+    def __init__(self, model_file, proof_file, workers: int = None, tracer: Tracer = None):
+        self.workers = workers or os.cpu_count() or 1
+        super().__init__(model_file, proof_file, tracer=tracer)
+        self.failed = self.check_obligations()
+        if self.failed:
+            raise Exception("RUP Failed -- Refutation Failed at constraints " + " ".join(map(str, self.failed)))
+        if self.tracer.level >= INFO:
+            self.tracer.write("ALL %d RUP STEPS VERIFIED" % len(self.model.obligations))
+            self.tracer.flush()
+
+    def check_obligations(self) -> List[int]:
+        obligations = self.model.obligations
+        if not obligations:
+            return []
+        buffers = self.model.constraint_db.buffers()
+        buffers["deaths"] = self.model.deaths
+        blocks = []
+        layout = {}
+        try:
+            for name, buffer in buffers.items():
+                data = memoryview(buffer).cast("B")
+                shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+                shm.buf[:len(data)] = data
+                blocks.append(shm)
+                layout[name] = (shm.name, buffer.typecode, len(buffer))
+            size = -(-len(obligations) // self.workers)
+            runs = [obligations[i:i + size] for i in range(0, len(obligations), size)]
+            with ProcessPoolExecutor(self.workers, initializer=attach,
+                                     initargs=(layout, self.model.constraint_db.overflow)) as pool:
+                return sorted(cid for failed in pool.map(check_obligations, runs) for cid in failed)
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: %s model_file proof_file [workers]' % sys.argv[0])
+        sys.exit(1)
+    ParallelProof(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else None)
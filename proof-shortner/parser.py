@@ -1,5 +1,4 @@
-import re
-import io
+from tokenizer import read_lines
 
 def parse_pol_step(line):
     return line.split()[1:-1]
@@ -10,44 +9,38 @@ def parse_rup_step(line):
 def parse_imply_add_step(line):
     return line.split()[2:-1]
 
-def run_parser(input_file):
-    # Parse the input file and return a list of constraints
+def iter_proof(input_file):
+    """
+    Streams (constraint id, tokens) for every step that derives a constraint. Nothing is checked: a `j` step
+    yields its stated constraint without verifying the implication, see PBModel.admit_j_step for that.
+    """
     no_of_formulas = 0
-    proof_db = {}
-    f = io.open(input_file, 'r')
-    for line in f.readlines():
-        # proof in veripb version
-        if line == 'pseudo-Boolean proof version 1.0\n':
-            # print("--version--")
+    for line_no, offset, line in read_lines(input_file):
+        line = line.decode()
+        if not line:
             continue
-        # comment
-        elif line[0] == '*':
-            # print("--comment--")
+        # proof in veripb version, comments and levels
+        elif line.startswith('pseudo-Boolean proof') or line[0] in '*#':
             continue
         # number of formulas in formula file, can be useful to assert.
         elif line[0] == 'f':
-            m = int(line.split()[1])
-            if type(m) == int:
-                no_of_formulas = m
-                # print("--no_of_formulas--", no_of_formulas)
-            else:
-                raise ValueError('Invalid formula line: %s' % line)
-        elif line[0] == '#':
-            pass
-        elif line[0] == 'u':
-            no_of_formulas += 1
-            print(str(no_of_formulas)+ ": " + " ".join(parse_pol_step(line)))
-            proof_db[no_of_formulas] = parse_pol_step(line)
+            no_of_formulas = int(line.split()[1])
         elif line[0] == 'j':
-            # parses the line and adds the constraint to the formula db.
-            # TODO: do the implication 
             no_of_formulas += 1
-            print(str(no_of_formulas)+ ": " + " ".join(parse_pol_step(line)))
-            proof_db[no_of_formulas] = parse_pol_step(line)
+            yield no_of_formulas, parse_imply_add_step(line)
+        elif line[0] == 'u':
+            no_of_formulas += 1
+            yield no_of_formulas, parse_rup_step(line)
         elif line[0] == 'p':
             no_of_formulas += 1
-            print(str(no_of_formulas)+ ": " + " ".join(parse_pol_step(line)))
-            proof_db[no_of_formulas] = parse_pol_step(line)
+            yield no_of_formulas, parse_pol_step(line)
+
+def run_parser(input_file):
+    # Parse the input file and return a dict of constraints
+    proof_db = {}
+    for no_of_formulas, step in iter_proof(input_file):
+        print(str(no_of_formulas)+ ": " + " ".join(step))
+        proof_db[no_of_formulas] = step
     return proof_db
 
 if __name__ == '__main__':
@@ -1,7 +1,19 @@
-from typing import Iterable, Dict
+from typing import Iterable, Dict, Iterator, List, Tuple
 from collections import defaultdict
-import copy
-from math import ceil
+from array import array
+import argparse
+import sys
+import time
+from propagator import Propagator
+from slack import BatchSlack
+from checkpoint import Checkpointer
+from compiled import CompiledTokenizer, is_compiled
+from cutting_planes import Accumulator, PolEvaluator
+from tokenizer import Step, Tokenizer, follow_lines
+from tracer import DEBUG, INFO, QUIET, STEPS, Tracer
+
+
+SCRATCH = Accumulator()  # shared by the static arithmetic helpers, always left cleared
 
 
 class PBConstraint:
@@ -17,7 +29,7 @@ class PBConstraint:
 
     def is_unsatisfied(self, assignment: Iterable) -> bool:
         """
-        :param: assignment: the assignment
+        :param: assignment: the true literals, a Trail or a set so that membership tests are O(1)
         :return: True if the constraint is satisfied in the `assignment`, i.e. one of its literals is True.
         """
         return self.slack(assignment) < 0
@@ -37,260 +49,861 @@ class PBConstraint:
 
     def slack(self, assignment: Iterable) -> int:
         """
-        :param: assignment: the assignment
+        :param: assignment: the true literals, a Trail or a set
         :return: the slack of the constraint in the `assignment`, i.e. the number of literals not falsified by an assignment minus the degree.
         """
         temp = 0
-        for i in self.literals:
+        for i, coefficient in self.terms():
             if -i not in assignment:
-                temp += self.coefficients[i]
+                temp += coefficient
         temp -= self.degree
         return temp
 
     def propagate(self, assignment: Iterable) -> Iterable:
         """
-        :param: assignment: the assignment
+        :param: assignment: the true literals, a Trail or a set
         :return: the literals that need be added to the assignment to satisfy the constraint.
         """
 
         need_to_be_true = []
         slack = self.slack(assignment)
-        for i in self.literals:
+        for i, coefficient in self.terms():
             # if any assignment is falsified, skip it.
             if -i not in assignment:
-                if self.coefficients[i] > slack:
+                if coefficient > slack:
                     need_to_be_true.append(i)
         return need_to_be_true
 
+    def terms(self) -> Iterator[Tuple[int, int]]:
+        """
+        :return: an iterator over the (literal, coefficient) pairs of the constraint.
+        """
+        return ((i, self.coefficients[i]) for i in self.literals)
+
+    def canonical(self) -> Tuple[Tuple[Tuple[int, int], ...], int]:
+        """
+        :return: the normalized form, positive coefficients with opposite literals cancelled, as the pair
+        (terms sorted by literal, degree); syntactic variants of one constraint get the same form.
+        """
+        terms, degree = Propagator.normalized_terms(self)
+        return tuple(sorted(terms.items())), degree
+
+    def copy(self) -> "PBConstraint":
+        """
+        :return: an independent PBConstraint with the same literals, coefficients and degree.
+        """
+        new_constraint = PBConstraint.__new__(PBConstraint)
+        new_constraint.literals = set(self.literals)
+        new_constraint.coefficients = defaultdict(int, self.coefficients)
+        new_constraint.degree = self.degree
+        new_constraint.no_of_literals = self.no_of_literals
+        return new_constraint
+
     def negation(self):
         for i in self.literals:
             self.coefficients[i] = - self.coefficients[i]
         self.degree = -self.degree + 1
         self.coefficient_normalized_form()
 
-    def implies(self, constraint):
+    def implies(self, constraint) -> bool:
         """
-        TODO: check if self semantically implies other constraint
-        :param: constraint 
-        :return: True if self semantically implies other constraint
+        Syntactic implication check in one merge over the sorted canonical forms: weaken away the literals of self
+        that `constraint` lacks, then the excess of the shared ones over the coefficients of `constraint`,
+        saturating as the degree drops, and compare the degrees that are left. It is sound but not complete;
+        False only means that this check could not show the implication.
+        :param: constraint: a PBConstraint
+        :return: True if self implies `constraint`.
         """
-        weaken_cost = 0
-        for i in constraint.literals:
-            if i not in self.literals:
-                return False
+        terms, degree = self.canonical()
+        other_terms, other_degree = constraint.canonical()
+        if other_degree <= 0:
+            return True
+        k = 0
+        n = len(other_terms)
+        shared = []  # (coefficient, bound) of literals whose coefficient exceeds the one in `constraint`
+        for literal, coefficient in terms:
+            while k < n and other_terms[k][0] < literal:
+                k += 1
+            if k < n and other_terms[k][0] == literal:
+                if coefficient > other_terms[k][1]:
+                    shared.append((coefficient, other_terms[k][1]))
             else:
-                if self.coefficients[i] < constraint.coefficients[i]:
-                    return False
-                else:
-                    weaken_cost += self.coefficients[i] - \
-                        constraint.coefficients[i]
-        if self.degree < constraint.degree:
-            return False
-        else:
-            weaken_cost += self.degree - constraint.degree
-        return weaken_cost
+                degree -= min(coefficient, degree)
+        for coefficient, bound in shared:
+            coefficient = min(coefficient, degree)  # saturation
+            if coefficient > bound:
+                degree -= coefficient - bound
+        return degree >= other_degree
 
     def saturation(self):
         for i in self.literals:
             self.coefficients[i] = min(self.coefficients[i], self.degree)
 
+    @staticmethod
+    def from_accumulator(accumulator: Accumulator) -> "PBConstraint":
+        """
+        :return: the normalized constraint held by `accumulator`, which is cleared.
+        """
+        literals, coefficients, degree = accumulator.result()
+        return PBConstraint(literals, coefficients, degree)
+
     @staticmethod
     def multiply(constraint, constant):
-        for i in constraint.literals:
-            constraint.coefficients[i] = constraint.coefficients[i] * constant
-        constraint.degree = constraint.degree * constant
-        constraint.coefficient_normalized_form()
+        SCRATCH.add_terms(constraint.terms(), constraint.degree)
+        SCRATCH.multiply(constant)
+        return PBConstraint.from_accumulator(SCRATCH)
 
     @staticmethod
     def add(constraint1, constraint2):
-        new_constraint = copy.deepcopy(constraint1)
-        for i in constraint2.literals:
-            new_constraint.coefficients[i] += constraint2.coefficients[i]
-        new_constraint.degree += constraint2.degree
-        new_constraint.coefficient_normalized_form()
-        return new_constraint
+        SCRATCH.add_terms(constraint1.terms(), constraint1.degree)
+        SCRATCH.add_terms(constraint2.terms(), constraint2.degree)
+        return PBConstraint.from_accumulator(SCRATCH)
 
     @staticmethod
     def subtract(constraint1, constraint2):
-        new_constraint = copy.deepcopy(constraint1)
-        for i in constraint2.literals:
-            new_constraint.coefficients[i] -= constraint2.coefficients[i]
-        new_constraint.degree -= constraint2.degree
-        new_constraint.coefficient_normalized_form()
-        return new_constraint
+        SCRATCH.add_terms(constraint1.terms(), constraint1.degree)
+        SCRATCH.add_terms(constraint2.terms(), constraint2.degree, -1)
+        return PBConstraint.from_accumulator(SCRATCH)
 
     @staticmethod
     def divide(constraint1, constant):
-        new_constraint = copy.deepcopy(constraint1)
-        for i in new_constraint.literals:
-            new_constraint.coefficients[i] = ceil(
-                new_constraint.coefficients[i] / constant)
-        new_constraint.degree = ceil(new_constraint.degree / constant)
-        new_constraint.coefficient_normalized_form()
-        return new_constraint
+        SCRATCH.add_terms(constraint1.terms(), constraint1.degree)
+        SCRATCH.divide(constant)
+        return PBConstraint.from_accumulator(SCRATCH)
 
     def __str__(self) -> str:
         #  dictionary to string keys and values space seprated
         temp = ""
-        for i in self.literals:
+        for i, coefficient in self.terms():
             if i > 0:
-                temp += str(self.coefficients[i]) + " x" + str(i) + " + "
+                temp += str(coefficient) + " x" + str(i) + " + "
             else:
-                temp += str(self.coefficients[i]) + " ~x" + str(-i) + " + "
+                temp += str(coefficient) + " ~x" + str(-i) + " + "
         temp = temp[:-3] + " >= " + str(self.degree)
         return temp
 
 
+class ConstraintView(PBConstraint):
+    """
+    A PBConstraint backed by one slot of a ConstraintStore. Reading it never materializes sets or dicts;
+    apart from saturation it is immutable, take a `copy()` to do arithmetic on it.
+    """
+    __slots__ = ("store", "cid")
+
+    def __init__(self, store, cid: int):
+        self.store = store
+        self.cid = cid
+
+    @property
+    def literals(self):
+        start = self.store.offsets[self.cid]
+        return self.store.literals[start:start + self.store.lengths[self.cid]]
+
+    @property
+    def coefficients(self):
+        return dict(self.terms())
+
+    @property
+    def degree(self):
+        return self.store.degrees[self.cid]
+
+    @property
+    def no_of_literals(self):
+        return self.store.lengths[self.cid]
+
+    def terms(self) -> Iterator[Tuple[int, int]]:
+        start = self.store.offsets[self.cid]
+        end = start + self.store.lengths[self.cid]
+        return zip(self.store.literals[start:end], self.store.coefficients[start:end])
+
+    def copy(self) -> PBConstraint:
+        start = self.store.offsets[self.cid]
+        end = start + self.store.lengths[self.cid]
+        return PBConstraint(self.store.literals[start:end], self.store.coefficients[start:end], self.degree)
+
+    def saturation(self):
+        start = self.store.offsets[self.cid]
+        coefficients = self.store.coefficients
+        for k in range(start, start + self.store.lengths[self.cid]):
+            coefficients[k] = min(coefficients[k], self.degree)
+
+    def coefficient_normalized_form(self):
+        raise TypeError("stored constraints are immutable, take a copy() first")
+
+    def negation(self):
+        raise TypeError("stored constraints are immutable, take a copy() first")
+
+
+class ConstraintStore:
+    """
+    Arena-style constraint database. The literals and coefficients of all constraints are kept back to back in
+    two flat arrays; per constraint id only an offset, a length and a degree are stored. Indexing returns a
+    ConstraintView. Constraints whose coefficients or degree do not fit in 64 bits are kept as PBConstraints.
+    An id can also be an alias of another one, sharing its slice of the buffers.
+    """
+
+    def __init__(self):
+        self.literals = array("i")
+        self.coefficients = array("q")
+        self.offsets = array("q")
+        self.lengths = array("i")  # -1 marks an unused id
+        self.degrees = array("q")
+        self.overflow: Dict[int, PBConstraint] = {}
+        self.size = 0
+        self.garbage = 0  # buffer slots still taken by deleted constraints
+        self.shares: Dict[int, int] = {}  # offset -> number of further ids sharing the constraint stored there
+
+    def grow(self, cid: int) -> None:
+        while len(self.lengths) <= cid:
+            self.offsets.append(0)
+            self.lengths.append(-1)
+            self.degrees.append(0)
+
+    def __setitem__(self, cid: int, constraint: PBConstraint) -> None:
+        if cid in self:
+            raise KeyError("constraint id " + str(cid) + " is already in use")
+        self.grow(cid)
+        start = len(self.literals)
+        try:
+            for i, coefficient in constraint.terms():
+                self.coefficients.append(coefficient)
+                self.literals.append(i)
+            self.degrees[cid] = constraint.degree
+        except OverflowError:
+            del self.literals[start:]
+            del self.coefficients[start:]
+            self.overflow[cid] = constraint.copy()
+        else:
+            self.offsets[cid] = start
+            self.lengths[cid] = len(self.literals) - start
+        self.size += 1
+
+    def set_terms(self, cid: int, literals: List[int], coefficients: List[int], degree: int) -> None:
+        """
+        Stores the constraint with the given distinct literals and their coefficients without building a
+        PBConstraint for it, unless it overflows.
+        """
+        if cid in self:
+            raise KeyError("constraint id " + str(cid) + " is already in use")
+        self.grow(cid)
+        start = len(self.literals)
+        try:
+            self.literals.extend(literals)
+            self.coefficients.extend(coefficients)
+            self.degrees[cid] = degree
+        except OverflowError:
+            del self.literals[start:]
+            del self.coefficients[start:]
+            self.overflow[cid] = PBConstraint(literals, coefficients, degree)
+        else:
+            self.offsets[cid] = start
+            self.lengths[cid] = len(literals)
+        self.size += 1
+
+    def alias(self, cid: int, target: int) -> None:
+        """
+        Makes `cid` another id of the constraint stored under `target`, without copying it.
+        """
+        if cid in self:
+            raise KeyError("constraint id " + str(cid) + " is already in use")
+        self.grow(cid)
+        if target in self.overflow:
+            self.overflow[cid] = self.overflow[target]
+        else:
+            start = self.offsets[target]
+            self.offsets[cid] = start
+            self.lengths[cid] = length = self.lengths[target]
+            self.degrees[cid] = self.degrees[target]
+            if length:
+                self.shares[start] = self.shares.get(start, 0) + 1
+        self.size += 1
+
+    def __getitem__(self, cid: int) -> PBConstraint:
+        if cid in self.overflow:
+            return self.overflow[cid]
+        if not 0 <= cid < len(self.lengths) or self.lengths[cid] < 0:
+            raise KeyError(cid)
+        return ConstraintView(self, cid)
+
+    def __contains__(self, cid: int) -> bool:
+        return cid in self.overflow or (0 <= cid < len(self.lengths) and self.lengths[cid] >= 0)
+
+    def __iter__(self) -> Iterator[int]:
+        return (cid for cid in range(len(self.lengths)) if cid in self)
+
+    def __delitem__(self, cid: int) -> None:
+        if cid in self.overflow:
+            del self.overflow[cid]
+        elif cid in self:
+            start, length = self.offsets[cid], self.lengths[cid]
+            shared = self.shares.get(start) if length else None
+            if shared:
+                # another id still refers to the slice
+                if shared > 1:
+                    self.shares[start] = shared - 1
+                else:
+                    del self.shares[start]
+            else:
+                self.garbage += length
+            self.lengths[cid] = -1
+        else:
+            raise KeyError(cid)
+        self.size -= 1
+        if self.garbage > len(self.literals) // 2:
+            self.compact()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def compact(self) -> None:
+        """
+        Moves the live constraints to the front of fresh buffers so that deleted ones release their memory.
+        """
+        literals = array("i")
+        coefficients = array("q")
+        moved = {}  # old -> new offset of shared slices
+        for cid in range(len(self.lengths)):
+            length = self.lengths[cid]
+            if length >= 0:
+                start = self.offsets[cid]
+                if length and start in self.shares:
+                    if start in moved:
+                        self.offsets[cid] = moved[start]
+                        continue
+                    moved[start] = len(literals)
+                self.offsets[cid] = len(literals)
+                literals.extend(self.literals[start:start + length])
+                coefficients.extend(self.coefficients[start:start + length])
+        self.literals = literals
+        self.coefficients = coefficients
+        self.shares = {moved[start]: shared for start, shared in self.shares.items()}
+        self.garbage = 0
+
+    def buffers(self) -> Dict[str, array]:
+        """
+        :return: the arena buffers by name, see `from_buffers`.
+        """
+        return {"literals": self.literals, "coefficients": self.coefficients, "offsets": self.offsets,
+                "lengths": self.lengths, "degrees": self.degrees}
+
+    @staticmethod
+    def from_buffers(buffers, overflow: Dict[int, PBConstraint]) -> "ConstraintStore":
+        """
+        Builds a read-only store over existing buffers, e.g. memoryviews of shared memory.
+        """
+        store = ConstraintStore.__new__(ConstraintStore)
+        for name, buffer in buffers.items():
+            setattr(store, name, buffer)
+        store.overflow = overflow
+        store.shares = {}
+        store.size = sum(1 for length in store.lengths if length >= 0) + len(overflow)
+        store.garbage = 0
+        return store
+
+    def memory_usage(self) -> int:
+        """
+        :return: the number of bytes taken by the arena buffers (overflowed constraints not included).
+        """
+        buffers = [self.literals, self.coefficients, self.offsets, self.lengths, self.degrees]
+        return sum(sys.getsizeof(buffer) for buffer in buffers)
+
+
 class PBModel:
-    def __init__(self, filename):
+    # the attributes saved by `snapshot`
+    SNAPSHOT = ("no_of_variables", "no_of_constraints", "level", "level_ids", "peak_live", "interned", "hashes",
+                "aliases", "alias_of", "redundant", "implication_fallbacks", "max_coefficient_bits", "bigints",
+                "materialized", "never_materialized", "dependencies", "constraint_db")
+
+    def __init__(self, filename, record_dependencies: bool = False, tracer: Tracer = None, batch_slack: bool = False,
+                 vectorized: bool = None, lazy: bool = False):
+        """
+        :param: batch_slack: check RUP steps with slack.BatchSlack instead of the incremental Propagator
+        :param: vectorized: whether BatchSlack uses NumPy, by default whenever it is installed
+        :param: lazy: only store new constraints and leave the rest to their first use, see `materialize`
+        """
         self.filename = filename
-        self.constraint_db: Dict[str, PBConstraint] = {}
+        self.tracer = tracer or Tracer()
+        self.record_dependencies = record_dependencies
+        self.dependencies: Dict[int, Tuple[int, ...]] = {}  # derived id -> ids of the constraints it used
+        self.antecedents = set()  # ids of the constraints used by the last successful RUP check
+        self.constraint_db = ConstraintStore()
         self.no_of_variables = 0
         self.no_of_constraints = 0
+        self.level = 0
+        self.level_ids: Dict[int, List[int]] = defaultdict(list)  # level -> ids of constraints derived at it
+        self.peak_live = 0
+        self.interned: Dict[int, int] = {}  # hash of a canonical form -> id under which the propagator has it
+        self.hashes = array("q", [0])  # id -> hash of the canonical form of its constraint
+        self.aliases: Dict[int, List[int]] = {}  # id known to the propagator -> other live ids of its constraint
+        self.alias_of: Dict[int, int] = {}  # alias id -> id known to the propagator
+        self.redundant = 0  # derivations of a constraint that was already live
+        self.implication_fallbacks = 0  # j steps that needed propagation to be verified
+        self.max_coefficient_bits = 0  # bit length of the largest coefficient or degree seen
+        self.bigints = 0  # constraints with a coefficient or degree beyond 64 bits
+        self.lazy = lazy
+        self.unmaterialized: Dict[int, None] = {}  # ids stored since the last RUP check, in order
+        self.materialized = 0  # constraints of the lazy mode interned and propagated on first use
+        self.never_materialized = 0  # constraints of the lazy mode deleted before any use
+        self.tokenizer = CompiledTokenizer() if is_compiled(filename) else Tokenizer()
+        self.batch_slack = batch_slack
+        self.vectorized = vectorized
+        self.propagator = self.new_propagator()
+        self.pol_evaluator = PolEvaluator(self.constraint_db)
         self.parse()
 
-    def add_constraint(self, constraint: PBConstraint):
+    def new_id(self, coefficients: Iterable[int], degree: int, antecedents: Iterable[int]) -> int:
         self.no_of_constraints += 1
-        self.constraint_db[self.no_of_constraints] = constraint
-        print("constraint "+str(self.no_of_constraints)+" added: ", constraint)
+        cid = self.no_of_constraints
+        if self.record_dependencies:
+            self.dependencies[cid] = tuple(antecedents)
+        bits = max(max(coefficients, default=0), -min(coefficients, default=0), abs(degree)).bit_length()
+        if bits > self.max_coefficient_bits:
+            self.max_coefficient_bits = bits
+        if bits > 63:
+            self.bigints += 1
+        return cid
+
+    def no_of_live(self) -> int:
+        return len(self.constraint_db)
+
+    def added(self, cid: int, constraint) -> None:
+        """
+        The bookkeeping shared by every way of adding a constraint: its level, the peak and the trace.
+        """
+        if self.level > 0:
+            self.level_ids[self.level].append(cid)
+        self.peak_live = max(self.peak_live, self.no_of_live())
+        if self.tracer.level >= STEPS:
+            self.tracer.added(cid, constraint)
+
+    def add_terms(self, literals: List[int], coefficients: List[int], degree: int, antecedents: Iterable[int] = ()):
+        """
+        Adds the constraint with the given distinct literals and their coefficients; in lazy mode without ever
+        building a PBConstraint for it.
+        """
+        if not self.lazy:
+            self.add_constraint(PBConstraint(literals, coefficients, degree), antecedents)
+            return
+        cid = self.new_id(coefficients, degree, antecedents)
+        self.constraint_db.set_terms(cid, literals, coefficients, degree)
+        self.hashes.append(0)
+        self.unmaterialized[cid] = None
+        self.added(cid, self.constraint_db[cid])
+
+    def add_constraint(self, constraint: PBConstraint, antecedents: Iterable[int] = ()):
+        cid = self.new_id(constraint.coefficients.values(), constraint.degree, antecedents)
+        if self.lazy:
+            self.constraint_db[cid] = constraint
+            self.hashes.append(0)
+            self.unmaterialized[cid] = None
+            self.added(cid, constraint)
+            return
+        key = constraint.canonical()
+        digest = hash(key)
+        self.hashes.append(digest)
+        original = self.interned.get(digest)
+        if original is not None and self.constraint_db[original].canonical() == key:
+            # a live constraint derived again: share its storage and leave the propagator alone
+            self.constraint_db.alias(cid, original)
+            self.aliases.setdefault(original, []).append(cid)
+            self.alias_of[cid] = original
+            self.redundant += 1
+        else:
+            self.constraint_db[cid] = constraint
+            self.propagator.add(cid, constraint)
+            if original is None:
+                self.interned[digest] = cid
+        self.added(cid, constraint)
+
+    def materialize(self) -> None:
+        """
+        Lazy mode: interns the constraints stored since the last RUP check that are still live and hands
+        them to the propagator, which only RUP checks need. Constraints deleted before that, as happens a lot
+        between the `#` and `w` of a proof or to `p` steps that are only stepping stones, never cost more
+        than being stored. A repeated constraint becomes an alias as in `add_constraint` but keeps its own
+        slice of the arena.
+        """
+        store = self.constraint_db
+        for cid in self.unmaterialized:
+            constraint = store[cid]
+            key = constraint.canonical()
+            digest = hash(key)
+            self.hashes[cid] = digest
+            original = self.interned.get(digest)
+            if original is not None and store[original].canonical() == key:
+                self.aliases.setdefault(original, []).append(cid)
+                self.alias_of[cid] = original
+                self.redundant += 1
+            else:
+                self.propagator.add(cid, constraint)
+                if original is None:
+                    self.interned[digest] = cid
+        self.materialized += len(self.unmaterialized)
+        self.unmaterialized.clear()
+
+    def new_propagator(self):
+        if self.batch_slack:
+            return BatchSlack(self.record_dependencies, self.vectorized)
+        return Propagator(self.record_dependencies)
+
+    def is_live(self, cid: int) -> bool:
+        return cid in self.constraint_db
+
+    def delete_constraint(self, cid: int) -> None:
+        if not self.is_live(cid):
+            raise Exception("cannot delete constraint " + str(cid) + ": not in the database")
+        del self.constraint_db[cid]
+        if cid in self.unmaterialized:
+            del self.unmaterialized[cid]
+            self.never_materialized += 1
+        elif cid in self.alias_of:
+            original = self.alias_of.pop(cid)
+            others = self.aliases[original]
+            others.remove(cid)
+            if not others:
+                del self.aliases[original]
+        else:
+            self.propagator.remove(cid)
+            digest = self.hashes[cid]
+            others = self.aliases.pop(cid, None)
+            if others:
+                # the constraint stays live under its other ids, the first of them takes over
+                successor = others.pop(0)
+                del self.alias_of[successor]
+                for other in others:
+                    self.alias_of[other] = successor
+                if others:
+                    self.aliases[successor] = others
+                self.propagator.add(successor, self.constraint_db[successor])
+                if self.interned.get(digest) == cid:
+                    self.interned[digest] = successor
+            elif self.interned.get(digest) == cid:
+                del self.interned[digest]
+        if self.tracer.veripb:
+            self.tracer.deleted.append(cid)
+
+    def snapshot(self) -> Dict:
+        """
+        :return: the state to continue checking from with `restore`, in builtin types and arrays only so that
+        it pickles independently of where this module was imported from; meant to be pickled right away.
+        """
+        self.materialize()
+        store = self.constraint_db
+        if store.garbage:
+            store.compact()  # leaves the deleted constraints out of the snapshot
+        state = {name: getattr(self, name) for name in self.SNAPSHOT}
+        state["level_ids"] = dict(self.level_ids)
+        state["constraint_db"] = {
+            "buffers": store.buffers(),
+            "overflow": {cid: (list(c.literals), [c.coefficients[i] for i in c.literals], c.degree)
+                         for cid, c in store.overflow.items()},
+            "shares": store.shares,
+        }
+        return state
+
+    def restore(self, state: Dict) -> None:
+        """
+        Replaces the constraints of the model by those of a snapshot and rebuilds the propagator from them.
+        """
+        for name in self.SNAPSHOT:
+            setattr(self, name, state[name])
+        self.level_ids = defaultdict(list, self.level_ids)
+        db = state["constraint_db"]
+        self.constraint_db = ConstraintStore.from_buffers(
+            db["buffers"], {cid: PBConstraint(*terms) for cid, terms in db["overflow"].items()})
+        self.constraint_db.shares = db["shares"]
+        self.tokenizer.no_of_variables = max(self.tokenizer.no_of_variables, self.no_of_variables)
+        self.pol_evaluator = PolEvaluator(self.constraint_db, self.pol_evaluator.saturate)
+        self.unmaterialized.clear()
+        self.propagator = self.new_propagator()
+        for cid in self.constraint_db:
+            if cid not in self.alias_of:
+                self.propagator.add(cid, self.constraint_db[cid])
+
+    def admit_deletion(self, ids: Iterable[int]) -> None:
+        for cid in ids:
+            self.delete_constraint(cid)
+
+    def set_level(self, level: int) -> None:
+        self.level = level
+
+    def wipe_level(self, level: int) -> None:
+        """
+        Deletes every constraint derived at `level` or above.
+        """
+        for lvl in [i for i in self.level_ids if i >= level]:
+            for cid in self.level_ids.pop(lvl):
+                if self.is_live(cid):
+                    self.delete_constraint(cid)
 
     def constraint_parser(self, line: str) -> PBConstraint:
-        line = line[:-1].split(">=")
-        degree = int(line[1])
-        line = line[0].split()
-        coefficients = [int(line[i])
-                        for i in range(0, len(line), 2)]
-        literals = [int(line[i][1:]) if line[i][0] != "~" else -
-                    1*int(line[i][2:]) for i in range(1, len(line), 2)]
-        if len(coefficients) != len(literals):
-            raise Exception(
-                "unequal number of literals and coefficients")
-        temp = PBConstraint(literals, coefficients, degree)
-        self.no_of_variables += len(literals)
-        return temp
+        (literals, coefficients, degree), _ = self.tokenizer.constraint(line.encode().split())
+        return PBConstraint(literals, coefficients, degree)
 
     def parse(self) -> None:
-        with open(self.filename, "r") as f:
-            for line in f:
-
-                line = line.strip()
-                if not line.startswith("*") and len(line) > 0:
-                    temp = self.constraint_parser(line)
-                    self.add_constraint(temp)
-        print("MODEL PARSED -- NO OF CONSTRAINTS: ", self.no_of_constraints)
-
-    def admit_pol_step(self, statement: str) -> None:
-        statement = statement.split(" ")[1:-1]
-        stack = []
-        operations = ["+", "-", "*", "/"]
-        if len(statement) == 1:
-            temp = copy.deepcopy(self.constraint_db[int(statement[0])])
-            stack.append(temp)
-        for i in statement:
-            if i not in operations:
-                temp = copy.deepcopy(self.constraint_db[int(i)])
-                stack.append(temp)
+        for literals, coefficients, degree in self.tokenizer.model(self.filename):
+            if self.lazy and len(set(literals)) == len(literals):
+                self.add_terms(literals, coefficients, degree)
             else:
-                a = stack.pop()
-                b = stack.pop()
-                temp = None
-                if i == '+':
-                    temp = PBConstraint.add(a, b)
-                if i == '-':
-                    temp = PBConstraint.subtract(a, b)
-                if i == '*':
-                    raise NotImplementedError("multiplication is not yet implemented")
-                    # temp = PBConstraint.multiply(self.constraint_db[a], b)
-                if i == '/':
-                    raise NotImplementedError("division is not yet implemented")
-                    # temp = PBConstraint.divide(self.constraint_db[a], b)
-                stack.append(temp)
-        self.add_constraint(stack.pop())
-
-    def admit_j_step(self, line: str) -> None:
-        # constraint = self.constraint_parser(line[1:-1])
-        line = line[:-1].split(">=")
-        degree = int(line[1][:-1])
-        line = line[0].split()[2:]
-        coefficients = [int(line[i])
-                        for i in range(0, len(line), 2)]
-        literals = [int(line[i][1:]) if line[i][0] != "~" else -
-                    1*int(line[i][2:]) for i in range(1, len(line), 2)]
-        if len(coefficients) != len(literals):
-            raise Exception(
-                "unequal number of literals and coefficients")
-        temp = PBConstraint(literals, coefficients, degree)
-        self.add_constraint(temp)
-
-    def admit_rup_step(self, line: str) -> None:
-        print("RUP STEP: ", line[:-1])
-        constraint = self.constraint_parser(line[1:-1])
+                self.add_constraint(PBConstraint(literals, coefficients, degree))
+        self.no_of_variables = self.tokenizer.no_of_variables
+        if self.tracer.level >= INFO and not self.tracer.veripb:
+            self.tracer.write("MODEL PARSED -- NO OF CONSTRAINTS:  " + str(self.no_of_constraints))
+
+    def admit_pol_step(self, statement: List[str]) -> None:
+        """
+        :param: statement: the RPN tokens of the step, e.g. ["31", "62", "+"]
+        """
+        literals, coefficients, degree = self.pol_evaluator.evaluate(statement)
+        self.add_terms(literals, coefficients, degree, PolEvaluator.operand_ids(statement))
+
+    def admit_j_step(self, source: int, constraint: PBConstraint) -> None:
+        """
+        Verifies that the constraint `source` implies `constraint`: syntactically if possible, otherwise by unit
+        propagation on `source` and the negation of `constraint` alone.
+        """
+        premise = self.constraint_db[source]
+        if not premise.implies(constraint):
+            self.implication_fallbacks += 1
+            propagator = Propagator()
+            propagator.add(source, premise)
+            negation = constraint.copy()
+            negation.negation()
+            if not propagator.check(negation):
+                if self.tracer.level >= INFO:
+                    self.tracer.write("    Implication Failed -- cannot add constraint")
+                raise Exception("Implication Failed -- constraint " + str(source) + " does not imply " +
+                                str(constraint))
+        self.add_constraint(constraint, (source,))
+
+    def admit_equals_step(self, cid: int, constraint: PBConstraint) -> None:
+        """
+        Verifies that the live constraint `cid` is `constraint`, up to the normalized form; derives nothing.
+        """
+        if not self.is_live(cid) or self.constraint_db[cid].canonical() != constraint.canonical():
+            if self.tracer.level >= INFO:
+                self.tracer.write("    Equality Check Failed -- constraint " + str(cid) + " differs")
+            raise Exception("Equality Check Failed -- constraint " + str(cid) + " is not " + str(constraint))
+
+    def admit_rup_step(self, constraint: PBConstraint, hints: Iterable[int] = ()) -> None:
+        tracer = self.tracer
+        verbose = tracer.level >= STEPS and not tracer.veripb
+        if verbose:
+            tracer.write("RUP STEP:  " + str(constraint))
         constraint.negation()
-        if not self.rup(constraint):
-            print("    RUP Failed -- cannot add constraint")
+        if not self.rup(constraint, hints):
+            if tracer.level >= INFO:
+                tracer.write("    RUP Failed -- cannot add constraint")
             raise Exception("RUP Failed -- Refutation Failed.")
-        print("    RUP Succeeded")
+        if verbose:
+            tracer.write("    RUP Succeeded")
         constraint.negation()
-        self.add_constraint(constraint)
-
-    def rup(self, constraint: PBConstraint) -> bool:
-        tau = constraint.propagate([])
-        print("    ASSIGNMENT: ", tau)
-        while True:
-            unit_propagated = False
-            for c in self.constraint_db:
-                if self.constraint_db[c].is_unsatisfied(tau):
-                    return True
-            for c in self.constraint_db:
-                c_propagates = self.constraint_db[c].propagate(tau)
-                if c_propagates != []:
-                    tau.append(c_propagates)
-                    unit_propagated = True
-                    break
-            if not unit_propagated:
-                return False
-
-    def admit_check_contradiction(self, line: str) -> None:
-        id = int(line.split()[1])
-        if self.constraint_db[id].is_unsatisfied([]):
-            print("Contradiction Found")
-        else:
-            print("Incorrect Contradiction Claimed")
+        self.add_constraint(constraint, self.antecedents)
+
+    def rup(self, constraint: PBConstraint, hints: Iterable[int] = ()) -> bool:
+        """
+        :param: constraint: the negation of the constraint to be derived
+        :param: hints: ids of constraints expected to suffice for the conflict, tried before the whole database;
+        ids of constraints that are not live are ignored
+        :return: True if unit propagation on the database together with `constraint` reaches a conflict.
+        """
+        if self.tracer.level >= DEBUG and not self.tracer.veripb:
+            self.tracer.write("    ASSIGNMENT:  " + str(constraint.propagate([])))
+        if hints:
+            propagator = Propagator(self.record_dependencies)
+            for cid in hints:
+                if cid in self.constraint_db:  # deleted or unknown ids are left to the whole database
+                    propagator.add(cid, self.constraint_db[cid])
+            if propagator.check(constraint):
+                self.antecedents = propagator.antecedents
+                return True
+            if self.tracer.level >= INFO and not self.tracer.veripb:
+                self.tracer.write("    RUP hints insufficient -- propagating the whole database")
+        if self.unmaterialized:
+            self.materialize()
+        if not self.propagator.check(constraint):
+            return False
+        self.antecedents = self.propagator.antecedents
+        return True
+
+    def admit_check_contradiction(self, id: int) -> bool:
+        found = self.constraint_db[id].is_unsatisfied([])
+        if self.tracer.level >= INFO and not self.tracer.veripb:
+            self.tracer.write("Contradiction Found" if found else "Incorrect Contradiction Claimed")
+        return found
 
 
 class PBProof:
-    def __init__(self, model_file, proof_file):
-        self.proof_file = proof_file
-        self.model = PBModel(model_file)
+    model_class = PBModel
+
+    def __init__(self, model_file, proof_file=None, record_dependencies: bool = False, profiler=None,
+                 tracer: Tracer = None, checkpointer: Checkpointer = None, resume: str = None, follow: bool = False,
+                 idle_timeout: float = None, saturate: bool = False, batch_slack: bool = False,
+                 vectorized: bool = None, lazy: bool = False):
+        """
+        :param: model_file: an OPB model, or a proof compiled by `compiled.compile_proof`
+        :param: proof_file: the VeriPB proof, None if the model file is compiled
+        :param: profiler: a profiler.Profiler to time every step with, None to check without instrumentation
+        :param: tracer: where the output goes and how much of it, a Tracer at level INFO on stdout by default
+        :param: checkpointer: takes snapshots of the check as it goes, see checkpoint.Checkpointer
+        :param: resume: a snapshot to continue the check from instead of starting with the first step
+        :param: follow: check the proof while it is being written, see tokenizer.follow_lines; the proof file
+        can then be a FIFO, or "-" for stdin
+        :param: idle_timeout: in follow mode, how long to wait for a growing proof file to grow
+        :param: saturate: saturate the results of `p` steps, see cutting_planes.PolEvaluator
+        :param: batch_slack: check RUP steps by batch slack evaluation, see slack.BatchSlack
+        :param: vectorized: whether batch slack evaluation uses NumPy, by default whenever it is installed
+        :param: lazy: leave interning and propagating new constraints to their first use, see PBModel.materialize
+        """
+        self.proof_file = model_file if proof_file is None else proof_file
+        self.profiler = profiler
+        self.tracer = tracer or Tracer()
+        self.checkpointer = checkpointer
+        self.follow = follow
+        self.idle_timeout = idle_timeout
+        self.contradiction = False
+        self.start = 0  # where the tokenizer starts reading the proof
+        self.line_no = 0
+        start = time.perf_counter()
+        self.model = self.model_class(model_file, record_dependencies, self.tracer, batch_slack, vectorized,
+                                      lazy)
+        if profiler is not None:
+            profiler.model_seconds = time.perf_counter() - start
         self.no_of_formulas = self.model.no_of_constraints
+        self.model.pol_evaluator.saturate = saturate
+        if resume is not None:
+            self.resume(Checkpointer.load(resume))
         self.parse()
 
+    def resume(self, state: Dict) -> None:
+        if state["no_of_formulas"] != self.no_of_formulas:
+            raise Exception("Number of formulas mismatch -- the checkpoint belongs to another model")
+        self.model.restore(state["model"])
+        self.contradiction = state["contradiction"]
+        self.start = state["position"]
+        self.line_no = state["line_no"]
+        if self.checkpointer is not None:
+            self.checkpointer.steps = state["steps"]
+            self.checkpointer.next = state["steps"] + self.checkpointer.every
+        if self.tracer.level >= INFO and not self.tracer.veripb:
+            self.tracer.write("RESUMED AT LINE:  %d -- NO OF CONSTRAINTS:  %d" % (
+                self.line_no + 1, self.model.no_of_constraints))
+
     def parse(self):
-        with open(self.proof_file, "r") as f:
-            for line in f:
-                if line[0] == '#':
-                    print("COMMENT: ", line[:-1])
-                    pass
-                elif line.startswith("pseudo"):
-                    print("FILE TYPE: ", line)
-                elif line[0] == 'f':
-                    print("FORMULA CHECK: ", line)
-                    f = int(line.split()[1])
-                    if type(f) == int:
-                        if f != self.no_of_formulas:
-                            raise Exception("Number of formulas mismatch")
-                elif line[0] == 'p':
-                    self.model.admit_pol_step(line)
-                elif line[0] == 'u':
-                    self.model.admit_rup_step(line)
-                elif line[0] == 'j':
-                    self.model.admit_j_step(line)
-                elif line[0] == 'c':
-                    self.model.admit_check_contradiction(line)
+        tracer = self.tracer
+        tokenizer = self.model.tokenizer
+        if not self.follow:
+            steps = tokenizer.proof(self.proof_file, self.start, self.line_no)
+        elif isinstance(tokenizer, CompiledTokenizer):
+            raise Exception("a compiled proof is complete, there is nothing to follow")
+        else:
+            steps = tokenizer.steps(follow_lines(self.proof_file, start=self.start, line_no=self.line_no,
+                                                 idle_timeout=self.idle_timeout))
+        if self.checkpointer is not None:
+            steps = self.checkpointer.run(self, steps)
+        if tracer.veripb:
+            tracer.begin(self.proof_file)
+        try:
+            if self.profiler is None:
+                for step in steps:
+                    self.admit_step(step)
+            else:
+                self.profiler.run(self, steps)
+        finally:
+            if tracer.veripb:
+                tracer.end(self.contradiction)
+            tracer.flush()
+            if self.checkpointer is not None:
+                self.checkpointer.finish()
+        if tracer.level >= INFO and not tracer.veripb:
+            tracer.write("PEAK LIVE CONSTRAINTS:  %d OF %d" % (self.model.peak_live, self.model.no_of_constraints))
+            tracer.write("REDUNDANT DERIVATIONS:  %d" % self.model.redundant)
+            tracer.write("MAX COEFFICIENT BITS:  %d -- BIGINT CONSTRAINTS:  %d" % (
+                self.model.max_coefficient_bits, self.model.bigints))
+            propagator = self.model.propagator
+            if isinstance(propagator, Propagator):
+                counts = propagator.class_counts
+                tracer.write("PROPAGATOR CLASSES:  %s" % " -- ".join(
+                    "%d %s (%d PROPAGATIONS)" % (counts[name], name.upper(), propagator.class_propagations[name])
+                    for name in counts))
+            if self.model.lazy:
+                # constraints still waiting for their first RUP check at the end were never materialized either
+                tracer.write("MATERIALIZED CONSTRAINTS:  %d -- NEVER MATERIALIZED:  %d" % (
+                    self.model.materialized, self.model.never_materialized + len(self.model.unmaterialized)))
+            tracer.flush()
+
+    def admit_step(self, step: Step) -> None:
+        kind = step.kind
+        tracer = self.tracer
+        if tracer.veripb and tracer.level >= STEPS and kind != 'header':
+            tracer.line(step)
+        if kind == 'p':
+            self.model.admit_pol_step(step.args)
+        elif kind == 'u':
+            self.model.admit_rup_step(PBConstraint(*step.constraint), step.args)
+        elif kind == 'j':
+            self.model.admit_j_step(step.args[0], PBConstraint(*step.constraint))
+        elif kind == 'e':
+            self.model.admit_equals_step(step.args[0], PBConstraint(*step.constraint))
+        elif kind == 'd':
+            self.model.admit_deletion(step.args)
+        elif kind == '#':
+            self.model.set_level(step.args[0])
+        elif kind == 'w':
+            self.model.wipe_level(step.args[0])
+        elif kind == 'header':
+            if tracer.level >= INFO and not tracer.veripb:
+                tracer.write("FILE TYPE:  " + step.args[0])
+        elif kind == 'f':
+            if tracer.level >= INFO and not tracer.veripb:
+                tracer.write("FORMULA CHECK:  " + " ".join(map(str, step.args)))
+            if step.args[0] != self.no_of_formulas:
+                raise Exception("Number of formulas mismatch")
+            if tracer.veripb and tracer.level >= STEPS:
+                for cid in range(1, self.no_of_formulas + 1):
+                    tracer.added(cid, self.model.constraint_db[cid])
+        elif kind == 'c':
+            self.contradiction = self.model.admit_check_contradiction(step.args[0])
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Check a VeriPB proof of an OPB model.")
+    parser.add_argument("model_file")
+    parser.add_argument("proof_file", nargs="?", help="left out if the model file is a compiled proof")
+    parser.add_argument("-q", "--quiet", dest="level", action="store_const", const=QUIET, default=INFO)
+    parser.add_argument("-v", "--verbose", dest="level", action="store_const", const=STEPS,
+                        help="trace every derived constraint")
+    parser.add_argument("--debug", dest="level", action="store_const", const=DEBUG,
+                        help="also trace the assignments of RUP checks")
+    parser.add_argument("--veripb", action="store_true", help="trace in the format of VeriPB --trace")
+    parser.add_argument("--trace", help="write the output to this file instead of stdout")
+    parser.add_argument("--checkpoint", help="write snapshots of the check to this file")
+    parser.add_argument("--checkpoint-steps", type=int, default=0, help="steps between snapshots")
+    parser.add_argument("--checkpoint-seconds", type=float, default=600.0, help="seconds between snapshots")
+    parser.add_argument("--resume", help="continue the check from this snapshot")
+    parser.add_argument("--follow", action="store_true",
+                        help="check the proof while it is written, the proof file may be a FIFO or - for stdin")
+    parser.add_argument("--idle-timeout", type=float, help="stop following a file that stopped growing")
+    parser.add_argument("--saturate", action="store_true", help="saturate every sum of a p step")
+    parser.add_argument("--lazy", action="store_true",
+                        help="only propagate the constraints that are still live at the next RUP step")
+    parser.add_argument("--batch-slack", action="store_true",
+                        help="check RUP steps by evaluating all slacks at once, with NumPy if installed")
+    args = parser.parse_args(argv)
+    if args.veripb and (args.proof_file is None or args.proof_file == "-"):
+        parser.error("--veripb echoes the lines of the text proof and needs it as a file")
+    level = max(args.level, STEPS) if args.veripb else args.level
+    tracer = Tracer(level, args.trace, args.veripb)
+    checkpointer = None
+    if args.checkpoint:
+        checkpointer = Checkpointer(args.checkpoint, args.checkpoint_steps, args.checkpoint_seconds)
+    try:
+        PBProof(args.model_file, args.proof_file, tracer=tracer, checkpointer=checkpointer, resume=args.resume,
+                follow=args.follow, idle_timeout=args.idle_timeout, saturate=args.saturate,
+                batch_slack=args.batch_slack, lazy=args.lazy)
+    finally:
+        tracer.close()
 
 
 if "__main__" == __name__:
-    # proof = PBProof('proof-shortner/proofs/rup_php65.opb', 'proof-shortner/proofs/rup_php65.pbp')
-    # proof = PBProof('proof-shortner/proofs/rup_fail.opb', 'proof-shortner/proofs/rup_fail.pbp')
-    proof = PBProof('proof-shortner/proofs/proof.opb',
-                    'proof-shortner/proofs/proof.pbp')
+    main()
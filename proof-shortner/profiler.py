@@ -0,0 +1,130 @@
+import csv
+import heapq
+import json
+import signal
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from tokenizer import Step
+
+
+class Profiler:
+    """
+    Opt-in instrumentation for PBProof: counts and wall time per rule, the propagations done by each rule and
+    the slowest individual steps with their line numbers, including a step that fails. Time spent waiting for
+    the tokenizer is accounted separately as parsing. A PBProof without a profiler runs its plain loop and
+    pays nothing for this.
+
+    The report can be written at any time, so long proofs can be profiled before they finish: every `every`
+    steps, on SIGUSR1 once `install_signal` was called, and when the check stops, also if it fails.
+    """
+
+    def __init__(self, output: str = None, top: int = 20, every: int = 0):
+        """
+        :param: output: the report file, CSV if it ends in ".csv" and JSON otherwise
+        :param: top: how many of the slowest steps to keep
+        :param: every: write the report every this many steps, 0 for only at the end
+        """
+        self.output = output
+        self.top = top
+        self.every = every
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.propagations: Dict[str, int] = defaultdict(int)
+        self.slowest: List[Tuple[float, int, str, int]] = []  # min-heap of (seconds, line, rule, propagations)
+        self.model_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.steps = 0
+        self.finished = False
+
+    def run(self, proof, steps: Iterable[Step]) -> None:
+        """
+        Admits `steps` into `proof` one at a time and records each of them.
+        """
+        clock = time.perf_counter
+        propagator = proof.model.propagator
+        try:
+            last = clock()
+            for step in steps:
+                start = clock()
+                self.parse_seconds += start - last
+                before = propagator.propagations
+                try:
+                    proof.admit_step(step)
+                finally:
+                    last = clock()
+                    self.record(step, last - start, propagator.propagations - before)
+            self.finished = True
+        finally:
+            if self.output:
+                self.write(self.output)
+
+    def record(self, step: Step, seconds: float, propagations: int) -> None:
+        kind = step.kind
+        self.counts[kind] += 1
+        self.seconds[kind] += seconds
+        self.propagations[kind] += propagations
+        entry = (seconds, step.line_no, kind, propagations)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+        self.steps += 1
+        if self.every and self.output and self.steps % self.every == 0:
+            self.write(self.output)
+
+    def report(self) -> Dict:
+        return {
+            "finished": self.finished,
+            "steps": self.steps,
+            "model_seconds": self.model_seconds,
+            "parse_seconds": self.parse_seconds,
+            "rules": {kind: {"count": self.counts[kind],
+                             "seconds": self.seconds[kind],
+                             "propagations": self.propagations[kind]} for kind in sorted(self.counts)},
+            "slowest": [{"line": line_no, "rule": kind, "seconds": seconds, "propagations": propagations}
+                        for seconds, line_no, kind, propagations in sorted(self.slowest, reverse=True)],
+        }
+
+    def write(self, filename: str) -> None:
+        report = self.report()
+        with open(filename, "w", newline="") as f:
+            if not filename.endswith(".csv"):
+                json.dump(report, f, indent=2)
+                return
+            writer = csv.writer(f)
+            writer.writerow(["section", "rule", "line", "count", "seconds", "propagations"])
+            writer.writerow(["model", "", "", "", report["model_seconds"], ""])
+            writer.writerow(["parse", "", "", report["steps"], report["parse_seconds"], ""])
+            for kind, row in report["rules"].items():
+                writer.writerow(["rule", kind, "", row["count"], row["seconds"], row["propagations"]])
+            for row in report["slowest"]:
+                writer.writerow(["step", row["rule"], row["line"], 1, row["seconds"], row["propagations"]])
+
+    def install_signal(self, signum: int = signal.SIGUSR1) -> None:
+        """
+        Writes the report whenever the process receives `signum`, e.g. `kill -USR1 <pid>`.
+        """
+        signal.signal(signum, lambda *_: self.write(self.output))
+
+    def summary(self) -> str:
+        lines = ["%-8s %8s %10s %12s" % ("rule", "count", "seconds", "propagations")]
+        for kind, row in self.report()["rules"].items():
+            lines.append("%-8s %8d %10.3f %12d" % (kind, row["count"], row["seconds"], row["propagations"]))
+        for seconds, line_no, kind, propagations in sorted(self.slowest, reverse=True)[:5]:
+            lines.append("line %-7d %-3s %8.4fs %8d propagations" % (line_no, kind, seconds, propagations))
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('Usage: %s model_file proof_file report.json|report.csv [top] [every]' % sys.argv[0])
+        sys.exit(1)
+    from pb_constraint import PBProof
+    profiler = Profiler(sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else 20,
+                        int(sys.argv[5]) if len(sys.argv) > 5 else 0)
+    profiler.install_signal()
+    PBProof(sys.argv[1], sys.argv[2], profiler=profiler)
+    print(profiler.summary())
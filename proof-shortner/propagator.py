@@ -0,0 +1,454 @@
+from typing import Dict, List
+from collections import defaultdict
+from math import gcd
+
+from trail import Trail
+
+
+class Propagator:
+    """
+    Incremental unit propagation over a database of normalized pseudo-Boolean constraints.
+
+    Constraints are told apart by class once normalized and reduced. Clauses, i.e. constraints in which every
+    literal on its own meets the degree, are propagated with two watched literals. Cardinality constraints,
+    whose coefficients are all 1 with a degree d above 1, watch d + 1 literals: while one of those is false
+    and no unwatched literal is left to take its place, the other d are implied. Every other constraint sits
+    in per-literal occurrence lists together with its slack, which is decreased as literals get falsified
+    rather than recomputed from scratch. A check only touches the constraints that contain or watch a
+    falsified literal. `class_counts` tells how many constraints of each class the database holds and
+    `class_propagations` how many literals each class has propagated.
+
+    The literals implied by the database alone stay on the trail between checks as its root, so a check
+    only propagates what the checked constraint adds on top of them. A constraint added to the database
+    is propagated against the root by the next check. A removed constraint only invalidates the root if it
+    was the reason of a root literal or part of a root conflict; the root is then rebuilt from scratch.
+    """
+
+    def __init__(self, record_antecedents: bool = True):
+        """
+        :param: record_antecedents: whether a successful check works out the constraints it used, which
+        costs a walk over the reasons of the conflict
+        """
+        self.record_antecedents = record_antecedents
+        self.clauses: Dict[int, List[int]] = {}  # clause id -> literals, the first two are watched
+        self.watches: Dict[int, List[int]] = defaultdict(list)  # literal -> ids of clauses watching it
+        self.cardinalities: Dict[int, List[int]] = {}  # id -> literals, the first degree + 1 are watched
+        self.cardinality_degrees: Dict[int, int] = {}
+        self.cardinality_watches: Dict[int, List[int]] = defaultdict(list)
+        self.terms: Dict[int, Dict[int, int]] = {}  # constraint id -> {literal: coefficient}
+        self.degrees: Dict[int, int] = {}
+        self.slacks: Dict[int, int] = {}  # slack under the literals processed so far
+        self.max_coefficients: Dict[int, int] = {}
+        self.occurrences: Dict[int, Dict[int, int]] = defaultdict(dict)  # literal -> {constraint id: coefficient}
+        self.units = set()  # ids of constraints that propagate under the empty assignment
+        self.falsified = set()  # ids of constraints that are unsatisfiable on their own
+        self.trail = Trail()
+        self.head = 0  # literals of the trail before `head` have been propagated
+        self.reasons: Dict[int, int] = {}  # literal -> id of the constraint that propagated it
+        self.conflict = None  # id of the constraint falsified by the last propagation
+        self.antecedents = set()  # ids of the constraints used by the last successful check
+        self.propagations = 0  # literals assigned over all checks so far
+        self.pending: List[int] = []  # ids of constraints added since the trail was last propagated
+        self.root = 0  # length of the root of the trail, implied by the database alone
+        self.root_reasons = set()  # ids of the constraints that propagated a root literal
+        self.root_conflict = None  # antecedents of a conflict of the database alone
+        self.root_stale = False  # a removed constraint was used by the root
+        self.class_propagations = {"clause": 0, "cardinality": 0, "general": 0}  # literals assigned
+
+    def add(self, cid: int, constraint) -> None:
+        """
+        Registers `constraint` under the id `cid`.
+        :param: cid: the id of the constraint
+        :param: constraint: a PBConstraint
+        """
+        terms, degree = self.normalized_terms(constraint)
+        if degree <= 0:
+            # trivially satisfied, can never propagate
+            return
+        if sum(terms.values()) < degree:
+            self.falsified.add(cid)
+            return
+        terms, degree = self.reduced_terms(terms, degree)
+        trail = self.trail
+        trail.ensure(max(max(terms), -min(terms)))
+        if min(terms.values()) >= degree:
+            literals = list(terms)
+            if trail.literals:
+                # watch literals that are not false on the trail, true ones first
+                values = trail.values
+                literals.sort(key=lambda literal: values[-literal] - values[literal])
+                if len(literals) == 1 or values[-literals[1]]:
+                    self.pending.append(cid)  # unit or falsified under the trail
+            self.clauses[cid] = literals
+            if len(literals) == 1:
+                self.units.add(cid)
+            else:
+                self.watches[literals[0]].append(cid)
+                self.watches[literals[1]].append(cid)
+            return
+        if max(terms.values()) == 1:
+            literals = list(terms)
+            if trail.literals:
+                values = trail.values
+                literals.sort(key=lambda literal: values[-literal] - values[literal])
+                if len(literals) == degree or values[-literals[degree]]:
+                    self.pending.append(cid)  # at most degree literals are not false under the trail
+            self.cardinalities[cid] = literals
+            self.cardinality_degrees[cid] = degree
+            if len(literals) == degree:
+                self.units.add(cid)
+            else:
+                for literal in literals[:degree + 1]:
+                    self.cardinality_watches[literal].append(cid)
+            return
+        self.terms[cid] = terms
+        self.degrees[cid] = degree
+        slack = sum(terms.values()) - degree
+        self.max_coefficients[cid] = max(terms.values())
+        for literal, coefficient in terms.items():
+            self.occurrences[literal][cid] = coefficient
+        if slack < self.max_coefficients[cid]:
+            self.units.add(cid)
+        if trail.literals:
+            # the literals the trail has processed already are not going to update the slack
+            values = trail.values
+            positions = trail.positions
+            for literal, coefficient in terms.items():
+                if values[-literal] and positions[-literal] < self.head:
+                    slack -= coefficient
+            self.pending.append(cid)
+        self.slacks[cid] = slack
+
+    @property
+    def class_counts(self) -> Dict[str, int]:
+        """
+        :return: the number of constraints in the database by class; constraints that are trivially satisfied or
+        unsatisfiable on their own belong to none.
+        """
+        return {"clause": len(self.clauses), "cardinality": len(self.cardinalities), "general": len(self.terms)}
+
+    @staticmethod
+    def normalized_terms(constraint):
+        """
+        :param: constraint: a PBConstraint, possibly with negative coefficients or opposite literals
+        :return: the pair ({literal: coefficient}, degree) of the equivalent constraint with positive coefficients.
+        """
+        terms = {}
+        degree = constraint.degree
+        for literal, coefficient in constraint.terms():
+            if coefficient < 0:
+                literal, coefficient = -literal, -coefficient
+                degree += coefficient
+            if coefficient > 0:
+                terms[literal] = terms.get(literal, 0) + coefficient
+        for literal in [i for i in terms if i > 0 and -i in terms]:
+            # c x + d ~x = (c - d) x + d
+            positive, negative = terms.pop(literal), terms.pop(-literal)
+            degree -= min(positive, negative)
+            if positive > negative:
+                terms[literal] = positive - negative
+            elif negative > positive:
+                terms[-literal] = negative - positive
+        return terms, degree
+
+    @staticmethod
+    def reduced_terms(terms: Dict[int, int], degree: int):
+        """
+        Saturates a normalized constraint with a positive degree and divides it by the gcd of its
+        coefficients. Both give an equivalent constraint over 0/1 values, so propagation is unaffected, but
+        the slacks stay within machine-sized ints even when cutting planes arithmetic has grown the
+        coefficients of the stored constraint into bigints.
+        :return: the reduced pair (terms, degree)
+        """
+        if max(terms.values()) > degree:
+            terms = {literal: min(coefficient, degree) for literal, coefficient in terms.items()}
+        divisor = gcd(*terms.values())
+        if divisor > 1:
+            terms = {literal: coefficient // divisor for literal, coefficient in terms.items()}
+            degree = -(-degree // divisor)
+        return terms, degree
+
+    def remove(self, cid: int) -> None:
+        """
+        Drops the constraint with id `cid` from every index. Unknown ids are ignored.
+        """
+        if cid in self.root_reasons or (self.root_conflict is not None and cid in self.root_conflict):
+            self.root_stale = True
+        self.falsified.discard(cid)
+        self.units.discard(cid)
+        if cid in self.clauses:
+            literals = self.clauses.pop(cid)
+            if len(literals) > 1:
+                self.watches[literals[0]].remove(cid)
+                self.watches[literals[1]].remove(cid)
+        elif cid in self.cardinalities:
+            literals = self.cardinalities.pop(cid)
+            degree = self.cardinality_degrees.pop(cid)
+            if len(literals) > degree:
+                for literal in literals[:degree + 1]:
+                    self.cardinality_watches[literal].remove(cid)
+        elif cid in self.terms:
+            for literal in self.terms.pop(cid):
+                del self.occurrences[literal][cid]
+            del self.degrees[cid]
+            del self.slacks[cid]
+            del self.max_coefficients[cid]
+
+    def check(self, constraint) -> bool:
+        """
+        :param: constraint: the (negated) constraint to propagate together with the database
+        :return: True if unit propagation on the database plus `constraint` runs into a conflict.
+        """
+        if self.falsified:
+            self.antecedents = {next(iter(self.falsified))}
+            return True
+        if not self.propagate_root():
+            self.antecedents = set(self.root_conflict)
+            return True
+        cid = -1  # ids of proof constraints are positive
+        self.add(cid, constraint)
+        try:
+            if not self.propagate():
+                return False
+            if self.record_antecedents:
+                self.antecedents = self.analyze()
+                self.antecedents.discard(cid)
+            return True
+        finally:
+            self.backtrack(self.root)
+            self.remove(cid)
+
+    def propagate_root(self) -> bool:
+        """
+        Brings the root of the trail up to date with the database, rebuilding it if it is stale.
+        :return: False if the database alone propagates to a conflict.
+        """
+        if self.root_stale:
+            self.backtrack()
+        if self.root_conflict is not None:
+            return False
+        if not self.pending and self.trail.literals:
+            return True
+        if self.propagate():
+            self.root_conflict = self.analyze()
+            return False
+        reasons = self.reasons
+        self.root_reasons.update(reasons[literal] for literal in self.trail.literals[self.root:])
+        self.propagations += len(self.trail) - self.root
+        self.root = len(self.trail)
+        return True
+
+    def literals_of(self, cid: int):
+        if cid in self.clauses:
+            return self.clauses[cid]
+        return self.cardinalities[cid] if cid in self.cardinalities else self.terms[cid]
+
+    def analyze(self) -> set:
+        """
+        Walks back from the falsified constraint over the reasons of the literals it saw falsified, and the
+        reasons of the literals that were falsified before those reasons propagated, and so on.
+        :return: the ids of the constraints that took part in deriving the last conflict.
+        """
+        values = self.trail.values
+        positions = self.trail.positions
+        used = {self.conflict}
+        stack = [-literal for literal in self.literals_of(self.conflict) if values[-literal]]
+        seen = set(stack)
+        while stack:
+            literal = stack.pop()
+            reason = self.reasons[literal]
+            used.add(reason)
+            position = positions[literal]
+            for other in self.literals_of(reason):
+                if values[-other] and -other not in seen and positions[-other] < position:
+                    seen.add(-other)
+                    stack.append(-other)
+        return used
+
+    def assign(self, literal: int, reason: int) -> bool:
+        """
+        Makes `literal` true because of the constraint with id `reason`.
+        :return: False if `literal` is already false, i.e. the assignment conflicts.
+        """
+        trail = self.trail
+        values = trail.values
+        if values[literal]:
+            return True
+        if values[-literal]:
+            self.conflict = reason
+            return False
+        # Trail.assign inlined, `add` has made room for every variable
+        values[literal] = 1
+        trail.positions[literal] = len(trail.literals)
+        trail.literals.append(literal)
+        self.reasons[literal] = reason
+        return True
+
+    def propagate(self) -> bool:
+        """
+        Unit propagates the database: starting from the empty assignment the constraints that propagate on
+        their own, otherwise the constraints added since the last propagation.
+        :return: True if a conflict has been reached.
+        """
+        values = self.trail.values
+        pending = self.pending if self.trail.literals else self.units
+        try:
+            for cid in pending:
+                if cid in self.clauses:
+                    literal = self.clauses[cid][0]
+                    if not values[literal]:
+                        if not self.assign(literal, cid):
+                            return True
+                        self.class_propagations["clause"] += 1
+                elif cid in self.cardinalities:
+                    if self.propagate_cardinality(cid):
+                        return True
+                elif cid in self.terms:
+                    slack = self.slacks[cid]
+                    if slack < 0:
+                        self.conflict = cid
+                        return True
+                    for literal, coefficient in self.terms[cid].items():
+                        if coefficient > slack and not values[-literal] and not values[literal]:
+                            if not self.assign(literal, cid):
+                                return True
+                            self.class_propagations["general"] += 1
+        finally:
+            self.pending.clear()
+        literals = self.trail.literals
+        while self.head < len(literals):
+            false_literal = -literals[self.head]
+            self.conflict = self.propagate_counting(false_literal)
+            self.head += 1
+            if (self.conflict is not None or self.propagate_watches(false_literal)
+                    or self.propagate_cardinalities(false_literal)):
+                return True
+        return False
+
+    def propagate_counting(self, false_literal: int):
+        """
+        Updates the slack of every general constraint containing `false_literal`.
+        :return: the id of a constraint that became unsatisfied, None if there is none.
+        """
+        conflict = None
+        values = self.trail.values
+        for cid, coefficient in self.occurrences[false_literal].items():
+            slack = self.slacks[cid] - coefficient
+            self.slacks[cid] = slack
+            if slack < 0:
+                if conflict is None:
+                    conflict = cid
+            elif conflict is None and slack < self.max_coefficients[cid]:
+                for literal, c in self.terms[cid].items():
+                    if c > slack and not values[literal] and not values[-literal]:
+                        self.assign(literal, cid)
+                        self.class_propagations["general"] += 1
+        return conflict
+
+    def propagate_watches(self, false_literal: int) -> bool:
+        """
+        Visits the clauses watching `false_literal` and moves their watch or propagates them.
+        :return: True if one of them became unsatisfied.
+        """
+        values = self.trail.values
+        clauses = self.clauses
+        watches = self.watches
+        watchers = watches[false_literal]
+        n = len(watchers)
+        i = 0
+        while i < n:
+            cid = watchers[i]
+            literals = clauses[cid]
+            first = literals[0]
+            if first == false_literal:
+                first = literals[0] = literals[1]
+                literals[1] = false_literal
+            if values[first]:
+                i += 1
+                continue
+            for k in range(2, len(literals)):
+                literal = literals[k]
+                if not values[-literal]:
+                    literals[1], literals[k] = literal, false_literal
+                    watches[literal].append(cid)
+                    n -= 1
+                    watchers[i] = watchers[n]
+                    watchers.pop()
+                    break
+            else:
+                if not self.assign(first, cid):
+                    return True
+                self.class_propagations["clause"] += 1
+                i += 1
+        return False
+
+    def propagate_cardinality(self, cid: int) -> bool:
+        """
+        Implies the watched literals of the cardinality constraint `cid` that are not false if there are just
+        as many of them as its degree.
+        :return: True if there are fewer, i.e. the constraint is unsatisfied.
+        """
+        values = self.trail.values
+        degree = self.cardinality_degrees[cid]
+        free = [literal for literal in self.cardinalities[cid][:degree + 1] if not values[-literal]]
+        if len(free) < degree:
+            self.conflict = cid
+            return True
+        if len(free) == degree:
+            for literal in free:
+                if not values[literal]:
+                    self.assign(literal, cid)
+                    self.class_propagations["cardinality"] += 1
+        return False
+
+    def propagate_cardinalities(self, false_literal: int) -> bool:
+        """
+        Visits the cardinality constraints watching `false_literal` and moves their watch to an unwatched
+        literal that is not false, or else propagates them.
+        :return: True if one of them became unsatisfied.
+        """
+        values = self.trail.values
+        watchers = self.cardinality_watches[false_literal]
+        i = 0
+        while i < len(watchers):
+            cid = watchers[i]
+            literals = self.cardinalities[cid]
+            degree = self.cardinality_degrees[cid]
+            for k in range(degree + 1, len(literals)):
+                literal = literals[k]
+                if not values[-literal]:
+                    position = literals.index(false_literal)
+                    literals[position], literals[k] = literal, false_literal
+                    self.cardinality_watches[literal].append(cid)
+                    watchers[i] = watchers[-1]
+                    watchers.pop()
+                    break
+            else:
+                if self.propagate_cardinality(cid):
+                    return True
+                i += 1
+        return False
+
+    def backtrack(self, length: int = 0) -> None:
+        """
+        Undoes the assignments from index `length` of the trail on and restores the slacks of the general
+        constraints; with the default of 0 the root is dropped as well.
+        """
+        trail = self.trail
+        literals = trail.literals
+        self.propagations += len(literals) - length
+        for literal in literals[length:self.head]:
+            for cid, coefficient in self.occurrences[-literal].items():
+                self.slacks[cid] += coefficient
+        reasons = self.reasons
+        for literal in literals[length:]:
+            del reasons[literal]
+        trail.truncate(length)
+        self.conflict = None
+        self.head = min(self.head, length)
+        if length == 0:
+            self.root = 0
+            self.root_reasons.clear()
+            self.root_conflict = None
+            self.root_stale = False
+            self.pending.clear()
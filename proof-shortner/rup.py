@@ -1,6 +1,8 @@
-from collections import deque
+import sys
+from collections import defaultdict, deque
 from typing import List, Iterable, Set, Dict, Tuple, Union
 from constraint import Constraint
+from trail import Trail
 # walks like sat rup, 
 # talks like sat rup, 
 # but one day i'll turn it into pb rup
@@ -24,7 +26,14 @@ class RUPchecker:
         return "refutation validated"
 
     def RUP(self, F:List[Constraint], L) -> bool:
-        tau = [-i for i in L.literals_list]
+        tau = Trail()
+        for i in L.literals_list:
+            if -i in tau:
+                continue
+            if i in tau:
+                # L is a tautology
+                return True
+            tau.assign(-i)
         while True:
             unit_propagated = False
             for c in F:
@@ -34,14 +43,256 @@ class RUPchecker:
             for c in F:
                 c_is_unit = c.unit(tau)
                 if c_is_unit != None:
-                    tau.append(c_is_unit)
+                    tau.assign(c_is_unit)
                     unit_propagated = True
-                    break
             if not unit_propagated:
                 return False
 
+Lemma = Union[List[int], Tuple[str, List[int]]]  # a clause to add, or ("d", clause) to delete one
+
+
+class BackwardRUPchecker:
+    """
+    DRAT-trim style backward checking of a clausal DRUP proof.
+
+    The formula and all lemmas are loaded once, applying deletions, and unit propagation on the resulting
+    database must reach a conflict, or on the database at the first empty lemma if there is one. Its reasons
+    are marked. The lemmas are then undone in reverse, deletions are undone by reactivating the clause, and
+    only marked lemmas are checked, each against the clauses live when it was derived. The reasons of every
+    conflict get marked in turn. Marked clauses are propagated first, so conflicts tend to stay in the
+    clauses that are already needed.
+
+    Clauses are propagated with two watched literals over a Trail and each check starts from an empty
+    assignment. Afterwards `core` holds the indices of the formula clauses that were used and `trimmed` the
+    lemmas that were, in proof order and ending with the empty clause.
+    """
+
+    def __init__(self, F: List[List[int]], Q: Iterable[Lemma]):
+        self.clauses: List[List[int]] = []  # clause id -> literals, the first two are watched
+        self.statements: List[List[int]] = []  # clause id -> literals as given
+        self.active = bytearray()
+        self.marked = bytearray()
+        self.watches: Dict[int, List[int]] = defaultdict(list)
+        self.units: List[int] = []  # ids of unit clauses
+        self.index: Dict[frozenset, List[int]] = defaultdict(list)  # literals -> ids of active clauses
+        self.steps: List[Tuple[str, int]] = []  # ("a", id) for a lemma, ("d", id) for a deletion
+        self.trail = Trail()
+        self.reasons: Dict[int, int] = {}  # literal -> id of the clause that propagated it
+        self.core: List[int] = []
+        self.trimmed: List[List[int]] = []
+        self.failed = None  # the lemma that failed
+        for clause in F:
+            self.add_clause(clause)
+        self.no_of_formulas = len(F)
+        self.ended = False  # the proof contains the empty clause
+        for lemma in Q:
+            if isinstance(lemma, tuple):
+                ids = self.index.get(frozenset(lemma[1]))
+                if ids:
+                    cid = ids.pop()
+                    self.active[cid] = 0
+                    self.steps.append(("d", cid))
+            elif not lemma:
+                self.ended = True
+                break
+            else:
+                self.steps.append(("a", self.add_clause(lemma)))
+
+    def add_clause(self, literals: List[int]) -> int:
+        cid = len(self.clauses)
+        literals = list(dict.fromkeys(literals))
+        self.clauses.append(literals)
+        self.statements.append(list(literals))
+        self.active.append(1)
+        self.marked.append(0)
+        self.index[frozenset(literals)].append(cid)
+        if literals:
+            self.trail.ensure(max(abs(i) for i in literals))
+        if len(literals) == 1:
+            self.units.append(cid)
+        elif len(literals) > 1:
+            self.watches[literals[0]].append(cid)
+            self.watches[literals[1]].append(cid)
+        return cid
+
+    def check(self) -> str:
+        if not self.rup([]):
+            return "invalid refutation"
+        for kind, cid in reversed(self.steps):
+            self.active[cid] = kind == "d"
+            if kind == "a" and self.marked[cid] and not self.rup(self.statements[cid]):
+                self.failed = self.statements[cid]
+                return "validation failed"
+        self.core = [cid for cid in range(self.no_of_formulas) if self.marked[cid]]
+        self.trimmed = [self.statements[cid] for kind, cid in self.steps if kind == "a" and self.marked[cid]]
+        self.trimmed.append([])
+        return "refutation validated"
+
+    def rup(self, lemma: List[int]) -> bool:
+        """
+        :return: True if propagating the active clauses under the negation of `lemma` reaches a conflict; the
+        clauses involved in it are then marked.
+        """
+        trail = self.trail
+        trail.clear()
+        self.reasons.clear()
+        values = trail.values
+        for literal in lemma:
+            if values[literal]:
+                # the lemma is a tautology
+                return True
+            if not values[-literal]:
+                self.assign(-literal, -1)
+        conflict = self.propagate_units()
+        if conflict is None:
+            conflict = self.propagate()
+        if conflict is None:
+            return False
+        self.analyze(conflict)
+        return True
+
+    def assign(self, literal: int, reason: int) -> None:
+        self.trail.assign(literal)
+        self.reasons[literal] = reason
+
+    def propagate_units(self):
+        """
+        :return: the id of a unit clause that is falsified, None if there is none.
+        """
+        values = self.trail.values
+        units = sorted((cid for cid in self.units if self.active[cid]), key=lambda cid: not self.marked[cid])
+        for cid in units:
+            literal = self.clauses[cid][0]
+            if values[-literal]:
+                return cid
+            if not values[literal]:
+                self.assign(literal, cid)
+        return None
+
+    def propagate(self):
+        """
+        Propagates marked clauses to a fixpoint before letting an unmarked clause propagate a single literal.
+        :return: the id of a falsified clause, None if propagation ends without a conflict.
+        """
+        literals = self.trail.literals
+        core_head = head = 0
+        while True:
+            if core_head < len(literals):
+                conflict = self.visit(-literals[core_head], 1)
+                core_head += 1
+            elif head < len(literals):
+                conflict = self.visit(-literals[head], 0)
+                head += 1
+            else:
+                return None
+            if conflict is not None:
+                return conflict
+
+    def visit(self, false_literal: int, marked: int):
+        """
+        Visits the active clauses watching `false_literal` whose mark equals `marked`.
+        :return: the id of a falsified clause, None if there is none.
+        """
+        values = self.trail.values
+        watchers = self.watches[false_literal]
+        clauses, active, marks = self.clauses, self.active, self.marked
+        i = 0
+        while i < len(watchers):
+            cid = watchers[i]
+            if not active[cid] or marks[cid] != marked:
+                i += 1
+                continue
+            literals = clauses[cid]
+            if literals[0] == false_literal:
+                literals[0], literals[1] = literals[1], literals[0]
+            first = literals[0]
+            if values[first]:
+                i += 1
+                continue
+            for k in range(2, len(literals)):
+                literal = literals[k]
+                if not values[-literal]:
+                    literals[1], literals[k] = literal, false_literal
+                    self.watches[literal].append(cid)
+                    watchers[i] = watchers[-1]
+                    watchers.pop()
+                    break
+            else:
+                if values[-first]:
+                    return cid
+                self.assign(first, cid)
+                i += 1
+        return None
+
+    def analyze(self, conflict: int) -> None:
+        """
+        Marks the falsified clause and, transitively, the reasons of its literals.
+        """
+        marked, reasons = self.marked, self.reasons
+        marked[conflict] = 1
+        stack = [-literal for literal in self.clauses[conflict]]
+        seen = set(stack)
+        while stack:
+            literal = stack.pop()
+            reason = reasons[literal]
+            if reason < 0:
+                continue
+            marked[reason] = 1
+            for other in self.clauses[reason]:
+                if other != literal and -other not in seen:
+                    seen.add(-other)
+                    stack.append(-other)
+
+
+def read_dimacs(filename) -> List[List[int]]:
+    """
+    :return: the clauses of a DIMACS CNF file.
+    """
+    clauses = []
+    clause = []
+    with open(filename) as f:
+        for line in f:
+            if line.startswith(("c", "p")):
+                continue
+            for token in line.split():
+                literal = int(token)
+                if literal == 0:
+                    clauses.append(clause)
+                    clause = []
+                else:
+                    clause.append(literal)
+    return clauses
+
+
+def read_drup(filename) -> List[Lemma]:
+    """
+    :return: the lemmas and ("d", clause) deletions of a DRUP proof in the text format of DRAT-trim.
+    """
+    lemmas: List[Lemma] = []
+    with open(filename) as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens or tokens[0] == "c":
+                continue
+            if tokens[0] == "d":
+                lemmas.append(("d", [int(token) for token in tokens[1:-1]]))
+            else:
+                lemmas.append([int(token) for token in tokens[:-1]])
+    return lemmas
+
+
 if __name__ == "__main__":
     formula = [[8, 9, 2, 3],[8, 9, -2, 3], [8, 9, 4, -3], [8, 9, -4, -3]]
     proof = [[8, 9, -3],[8, 9,  3],[8, 9]]
     check = RUPchecker(formula, proof)
-    print(check.RUPchecker())
\ No newline at end of file
+    print(check.RUPchecker())
+    if len(sys.argv) > 2:
+        # python rup.py formula.cnf proof.drup [trimmed.drup]
+        backward = BackwardRUPchecker(read_dimacs(sys.argv[1]), read_drup(sys.argv[2]))
+        print(backward.check())
+        print("core:", len(backward.core), "of", backward.no_of_formulas, "clauses,",
+              len(backward.trimmed) - 1, "of", len(backward.steps), "steps needed")
+        if len(sys.argv) > 3:
+            with open(sys.argv[3], "w") as f:
+                for lemma in backward.trimmed:
+                    f.write(" ".join(map(str, lemma + [0])) + "\n")
\ No newline at end of file
@@ -0,0 +1,278 @@
+import sys
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from propagator import Propagator
+
+try:
+    import numpy
+except ImportError:  # optional, the pure Python path computes the same slacks one constraint at a time
+    numpy = None
+
+Implied = List[Tuple[int, int]]  # (literal, id of the constraint that implies it)
+
+
+class Matrix:
+    """
+    The NumPy copy of the rows of a BatchSlack, rebuilt after constraints have been added or removed.
+    """
+
+    def __init__(self, engine: "BatchSlack"):
+        self.ids = numpy.frombuffer(engine.ids, numpy.int64).copy()
+        indptr = numpy.frombuffer(engine.indptr, numpy.int64)
+        self.starts = indptr[:-1].copy()
+        self.rows = numpy.repeat(numpy.arange(len(self.ids)), numpy.diff(indptr))
+        self.literals = numpy.frombuffer(engine.literals, numpy.int64).copy()
+        self.negated = -self.literals
+        self.coefficients = numpy.frombuffer(engine.coefficients, numpy.int64).copy()
+        self.totals = numpy.frombuffer(engine.totals, numpy.int64).copy()
+        self.live = self.ids >= 0
+        self.live_entries = self.live[self.rows]
+
+
+class BatchSlack:
+    """
+    Unit propagation in rounds over the whole database, as a drop-in replacement for the Propagator.
+
+    The live constraints are kept normalized as a CSR matrix: row pointers into one column of literals and
+    one of coefficients, and per row the slack under the empty assignment. A round computes the slack of
+    every constraint under the current assignment at once, which is a sparse matrix-vector product of the
+    coefficients with the 0/1 vector of falsified literals, then takes the falsified constraints and the
+    literals whose coefficient exceeds the slack of their constraint, and assigns all of the latter. Rounds
+    repeat until a conflict or until nothing new is implied.
+
+    With NumPy installed a round is a handful of array operations, which suits the dense cardinality
+    constraints of PHP and Sudoku encodings where one literal occurs in many constraints; without it the
+    same rounds run in pure Python. Either way a check rescans the database every round, so it is a
+    baseline for the incremental Propagator rather than a replacement on long propagation chains.
+
+    The assignment is a bytearray indexed by signed literals as in Trail, which NumPy indexes with the same
+    wrap around for negative literals. Constraints whose reduced coefficients do not fit in 64 bits are
+    evaluated one by one next to the matrix.
+    """
+
+    def __init__(self, record_antecedents: bool = True, vectorized: Optional[bool] = None):
+        """
+        :param: vectorized: compute the slacks with NumPy, by default whenever it is installed
+        """
+        if vectorized and numpy is None:
+            raise ImportError("the vectorized batch slack engine needs NumPy")
+        self.vectorized = numpy is not None if vectorized is None else vectorized
+        self.record_antecedents = record_antecedents
+        self.rows: Dict[int, int] = {}  # constraint id -> row
+        self.ids = array("q")  # row -> constraint id, -1 for removed constraints
+        self.indptr = array("q", [0])  # row -> start of its entries, with the end of the last one appended
+        self.literals = array("q")
+        self.coefficients = array("q")
+        self.totals = array("q")  # row -> sum of the coefficients minus the degree
+        self.big: Dict[int, Tuple[Dict[int, int], int]] = {}  # id -> (terms, degree) of the rest
+        self.falsified = set()  # ids of constraints that are unsatisfiable on their own
+        self.garbage = 0  # entries of removed rows
+        self.no_of_variables = 0
+        self.matrix: Optional[Matrix] = None
+        self.antecedents = set()  # ids of the constraints used by the last successful check
+        self.propagations = 0  # literals assigned over all checks so far
+        self.rounds = 0  # slack evaluations of the whole database over all checks so far
+
+    def add(self, cid: int, constraint) -> None:
+        """
+        Registers `constraint` under the id `cid`.
+        """
+        terms, degree = Propagator.normalized_terms(constraint)
+        if degree <= 0:
+            return
+        if sum(terms.values()) < degree:
+            self.falsified.add(cid)
+            return
+        terms, degree = Propagator.reduced_terms(terms, degree)
+        self.no_of_variables = max(self.no_of_variables, max(terms), -min(terms))
+        start = len(self.literals)
+        try:
+            self.coefficients.extend(terms.values())
+            self.totals.append(sum(terms.values()) - degree)
+        except OverflowError:
+            del self.coefficients[start:]
+            self.big[cid] = (terms, degree)
+            return
+        self.literals.extend(terms)
+        self.indptr.append(len(self.literals))
+        self.rows[cid] = len(self.ids)
+        self.ids.append(cid)
+        self.matrix = None
+
+    def remove(self, cid: int) -> None:
+        """
+        Drops the constraint with id `cid`. Unknown ids are ignored.
+        """
+        self.falsified.discard(cid)
+        self.big.pop(cid, None)
+        row = self.rows.pop(cid, None)
+        if row is None:
+            return
+        self.ids[row] = -1
+        self.garbage += self.indptr[row + 1] - self.indptr[row]
+        self.matrix = None
+        if self.garbage > len(self.literals) // 2:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Drops the rows of removed constraints.
+        """
+        ids, indptr, literals, coefficients, totals = array("q"), array("q", [0]), array("q"), array("q"), array("q")
+        for row, cid in enumerate(self.ids):
+            if cid >= 0:
+                start, end = self.indptr[row], self.indptr[row + 1]
+                self.rows[cid] = len(ids)
+                ids.append(cid)
+                literals.extend(self.literals[start:end])
+                coefficients.extend(self.coefficients[start:end])
+                indptr.append(len(literals))
+                totals.append(self.totals[row])
+        self.ids, self.indptr, self.literals, self.coefficients, self.totals = ids, indptr, literals, coefficients, totals
+        self.garbage = 0
+
+    def literals_of(self, cid: int, extra: Dict[int, Tuple[Dict[int, int], int]]):
+        row = self.rows.get(cid)
+        if row is None:
+            return extra[cid][0]
+        return self.literals[self.indptr[row]:self.indptr[row + 1]]
+
+    def scan(self, values: bytearray) -> Tuple[Optional[int], Implied]:
+        """
+        Computes the slack of every row under the true literals in `values`.
+        :return: the id of a falsified constraint or None, and the literals implied by the others
+        """
+        if not self.ids:
+            return None, []
+        if not self.vectorized:
+            return self.scan_rows(values)
+        if self.matrix is None:
+            self.matrix = Matrix(self)
+        m = self.matrix
+        assigned = numpy.frombuffer(values, numpy.uint8)
+        false = assigned[m.negated]
+        slacks = m.totals - numpy.add.reduceat(m.coefficients * false, m.starts)
+        conflicts = numpy.flatnonzero((slacks < 0) & m.live)
+        if conflicts.size:
+            return int(m.ids[conflicts[0]]), []
+        implied = numpy.flatnonzero((m.coefficients > slacks[m.rows]) & m.live_entries & (false == 0)
+                                    & (assigned[m.literals] == 0))
+        return None, list(zip(m.literals[implied].tolist(), m.ids[m.rows[implied]].tolist()))
+
+    def scan_rows(self, values: bytearray) -> Tuple[Optional[int], Implied]:
+        indptr, literals, coefficients, totals = self.indptr, self.literals, self.coefficients, self.totals
+        implied = []
+        for row, cid in enumerate(self.ids):
+            if cid < 0:
+                continue
+            start, end = indptr[row], indptr[row + 1]
+            slack = totals[row]
+            for k in range(start, end):
+                if values[-literals[k]]:
+                    slack -= coefficients[k]
+            if slack < 0:
+                return cid, []
+            for k in range(start, end):
+                literal = literals[k]
+                if coefficients[k] > slack and not values[literal] and not values[-literal]:
+                    implied.append((literal, cid))
+        return None, implied
+
+    @staticmethod
+    def scan_terms(constraints: Dict[int, Tuple[Dict[int, int], int]], values: bytearray) -> Tuple[Optional[int], Implied]:
+        implied = []
+        for cid, (terms, degree) in constraints.items():
+            slack = sum(coefficient for literal, coefficient in terms.items() if not values[-literal]) - degree
+            if slack < 0:
+                return cid, []
+            implied += [(literal, cid) for literal, coefficient in terms.items()
+                        if coefficient > slack and not values[literal] and not values[-literal]]
+        return None, implied
+
+    def check(self, constraint) -> bool:
+        """
+        :param: constraint: the (negated) constraint to propagate together with the database
+        :return: True if unit propagation on the database plus `constraint` runs into a conflict.
+        """
+        if self.falsified:
+            self.antecedents = {next(iter(self.falsified))}
+            return True
+        terms, degree = Propagator.normalized_terms(constraint)
+        extra = dict(self.big)
+        if degree > 0:
+            extra[-1] = (terms, degree)  # ids of proof constraints are positive
+        n = max(self.no_of_variables, max(terms, default=0), -min(terms, default=0))
+        values = bytearray(2 * n + 1)
+        rounds: Dict[int, int] = {}  # true literal -> round that assigned it
+        reasons: Dict[int, int] = {}
+        conflict = None
+        while conflict is None:
+            self.rounds += 1
+            conflict, implied = self.scan(values)
+            if conflict is None:
+                conflict, more = self.scan_terms(extra, values)
+                implied += more
+            if conflict is None:
+                if not implied:
+                    self.propagations += len(reasons)
+                    return False
+                for literal, cid in implied:
+                    # a literal implied both ways leaves a constraint falsified for the next round
+                    if not values[literal] and not values[-literal]:
+                        values[literal] = 1
+                        rounds[literal] = self.rounds
+                        reasons[literal] = cid
+        self.propagations += len(reasons)
+        self.antecedents = self.analyze(conflict, values, rounds, reasons, extra) if self.record_antecedents else set()
+        self.antecedents.discard(-1)
+        return True
+
+    def analyze(self, conflict: int, values: bytearray, rounds: Dict[int, int], reasons: Dict[int, int],
+                extra: Dict[int, Tuple[Dict[int, int], int]]) -> set:
+        """
+        :return: the ids of the constraints that took part in deriving the conflict, see Propagator.analyze.
+        """
+        used = {conflict}
+        stack = [-literal for literal in self.literals_of(conflict, extra) if values[-literal]]
+        seen = set(stack)
+        while stack:
+            literal = stack.pop()
+            reason = reasons[literal]
+            used.add(reason)
+            for other in self.literals_of(reason, extra):
+                if values[-other] and -other not in seen and rounds[-other] < rounds[literal]:
+                    seen.add(-other)
+                    stack.append(-other)
+        return used
+
+
+def benchmark(model_file: str, proof_file: str, repeat: int = 3) -> Dict[str, float]:
+    """
+    :return: the best time over `repeat` checks of the proof with the incremental Propagator and with the
+    batch slack engine, in pure Python and with NumPy if it is installed.
+    """
+    from pb_constraint import PBProof
+    from tracer import QUIET, Tracer
+
+    engines = {"propagator": None, "python": False}
+    if numpy is not None:
+        engines["numpy"] = True
+    seconds = {}
+    for name, vectorized in engines.items():
+        seconds[name] = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            PBProof(model_file, proof_file, tracer=Tracer(QUIET),
+                    batch_slack=name != "propagator", vectorized=vectorized)
+            seconds[name] = min(seconds[name], time.perf_counter() - start)
+    return seconds
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: %s model_file proof_file' % sys.argv[0])
+        sys.exit(1)
+    for engine, best in benchmark(sys.argv[1], sys.argv[2]).items():
+        print("%-12s %8.3fs" % (engine, best))
@@ -0,0 +1,534 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.generators import php_instances  # noqa: E402
+from constraint import CDCLSolver  # noqa: E402
+from pb_constraint import ConstraintStore, PBConstraint, PBProof  # noqa: E402
+from checkpoint import Checkpointer  # noqa: E402
+from compiled import CompiledTokenizer, compile_proof  # noqa: E402
+from cutting_planes import PolEvaluator  # noqa: E402
+from parallel import ParallelProof  # noqa: E402
+from profiler import Profiler  # noqa: E402
+from propagator import Propagator  # noqa: E402
+from rup import BackwardRUPchecker, RUPchecker  # noqa: E402
+from slack import BatchSlack  # noqa: E402
+from tokenizer import Tokenizer, read_lines  # noqa: E402
+from traceindex import TraceIndex, grep  # noqa: E402
+from tracer import QUIET, STEPS, Tracer  # noqa: E402
+from trail import Trail  # noqa: E402
+from trimmer import ProofTrimmer  # noqa: E402
+
+PROOFS = os.path.join(os.path.dirname(__file__), "..", "proofs")
+
+
+def check(name):
+    return PBProof(os.path.join(PROOFS, name + ".opb"), os.path.join(PROOFS, name + ".pbp"))
+
+
+def test_propagator_clausal_conflict():
+    propagator = Propagator()
+    propagator.add(1, PBConstraint([1, 2], [1, 1], 1))
+    propagator.add(2, PBConstraint([-1, 2], [1, 1], 1))
+    assert propagator.check(PBConstraint([-2], [1], 1))
+    assert not propagator.check(PBConstraint([-1], [1], 1))
+    assert len(propagator.trail) == 0 and 1 not in propagator.trail and -1 not in propagator.trail
+
+
+def test_propagator_counting_with_negative_coefficients():
+    propagator = Propagator()
+    # at most one of x1, x2, x3
+    propagator.add(1, PBConstraint([1, 2, 3], [-1, -1, -1], -1))
+    propagator.add(2, PBConstraint([1, 4], [1, 1], 1))
+    assert propagator.check(PBConstraint([2, -4], [1, 1], 2))
+    assert not propagator.check(PBConstraint([2], [1], 1))
+    assert propagator.cardinality_degrees[1] == 2  # ~x1 + ~x2 + ~x3 >= 2
+    # 2 ~x5 + ~x6 + ~x7 >= 2 is counted, its slack is restored after the check
+    propagator.add(3, PBConstraint([5, 6, 7], [-2, -1, -1], -2))
+    assert not propagator.check(PBConstraint([5], [1], 1))
+    assert propagator.slacks[3] == 2
+
+
+def test_propagator_conflict_core():
+    propagator = Propagator()
+    propagator.add(1, PBConstraint([1, 2], [1, 1], 1))
+    propagator.add(2, PBConstraint([-1, 2], [1, 1], 1))
+    propagator.add(3, PBConstraint([-3, 4], [1, 1], 1))
+    propagator.add(4, PBConstraint([5], [1], 1))
+    assert propagator.check(PBConstraint([-2, 3], [1, 1], 2))
+    assert propagator.antecedents == {1, 2}
+
+
+def test_constraint_store_views():
+    store = ConstraintStore()
+    store[1] = PBConstraint([1, -2], [2, 1], 2)
+    store[3] = PBConstraint([3], [2 ** 70], 1)
+    assert 1 in store and 2 not in store and len(store) == 2
+    assert list(store) == [1, 3]
+    assert str(store[1]) == "2 x1 + 1 ~x2 >= 2"
+    assert store[1].slack([-1]) == -1
+    total = PBConstraint.add(store[1], store[1])
+    assert total.degree == 4 and total.coefficients[1] == 4
+    assert store[1].degree == 2
+    store[1].saturation()
+    assert str(store[1]) == "2 x1 + 1 ~x2 >= 2"
+    assert store[3].coefficients[3] == 2 ** 70
+
+
+def test_add_cancels_opposite_literals():
+    total = PBConstraint.add(PBConstraint([1, 2], [1, 1], 1), PBConstraint([-1, 3], [1, 1], 1))
+    assert dict(total.terms()) == {2: 1, 3: 1} and total.degree == 1
+
+
+def test_pol_evaluator_multiply_divide_saturate():
+    store = ConstraintStore()
+    store[1] = PBConstraint([1, 2], [1, 1], 1)
+    store[2] = PBConstraint([1, 2, 3], [-1, -1, -1], -1)
+    evaluator = PolEvaluator(store)
+    literals, coefficients, degree = evaluator.evaluate("1 2 * 2 +".split())
+    assert dict(zip(literals, coefficients)) == {1: 1, 2: 1, -3: 1} and degree == 2
+    literals, coefficients, degree = evaluator.evaluate("1 3 * 2 + 2 /".split())
+    assert dict(zip(literals, coefficients)) == {1: 1, 2: 1, -3: 1} and degree == 2
+    literals, coefficients, degree = evaluator.evaluate("1 3 * s".split())
+    assert dict(zip(literals, coefficients)) == {1: 3, 2: 3} and degree == 3
+    assert str(store[1]) == "1 x1 + 1 x2 >= 1"
+
+
+def test_read_lines_across_chunks(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_bytes(b"first line\nsecond\n\nlast")
+    lines = list(read_lines(str(path), chunk_size=4))
+    assert lines == [(1, 0, b"first line"), (2, 11, b"second"), (3, 18, b""), (4, 19, b"last")]
+
+
+def test_tokenizer_model_and_proof(tmp_path):
+    model = tmp_path / "model.opb"
+    model.write_text("* comment\n+1 x1 -2 ~x3 = 1 ;\n")
+    proof = tmp_path / "proof.pbp"
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 2 0\np 1 2 + 3 * 0\nj 3  1 x1 >= 1 ;\nd 1 2\nc 4 0\n")
+    tokenizer = Tokenizer()
+    assert list(tokenizer.model(str(model))) == [([1, -3], [1, -2], 1), ([1, -3], [-1, 2], -1)]
+    steps = list(tokenizer.proof(str(proof)))
+    assert [step.kind for step in steps] == ["header", "f", "p", "j", "d", "c"]
+    assert steps[2].args == ("1", "2", "+", "3", "*")
+    assert steps[3].args == (3,) and steps[3].constraint == ([1], [1], 1)
+    assert steps[4].args == (1, 2) and steps[5].line_no == 6
+
+
+def test_tokenizer_degree_followed_by_semicolon(tmp_path):
+    tokenizer = Tokenizer()
+    assert tokenizer.constraint(b"1 x1 1 x2 >= 1;".split()) == (([1, 2], [1, 1], 1), b">=")
+    model = tmp_path / "model.opb"
+    model.write_text("1 x1 1 x2 >= 1;\n1 ~x1 = 0;\n")
+    assert list(tokenizer.model(str(model))) == [([1, 2], [1, 1], 1), ([-1], [1], 0), ([-1], [-1], 0)]
+    proof = tmp_path / "proof.pbp"
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 3\nu 1 x2 >= 1; 1 2\n")
+    step = list(tokenizer.proof(str(proof)))[2]
+    assert step.args == (1, 2) and step.constraint == ([2], [1], 1)
+
+
+def test_constraint_store_delete_and_compact():
+    store = ConstraintStore()
+    for cid in range(1, 5):
+        store[cid] = PBConstraint([cid, cid + 1], [1, 1], 1)
+    del store[1]
+    del store[2]
+    assert len(store) == 2 and 1 not in store and list(store) == [3, 4]
+    del store[3]
+    assert len(store.literals) == 2 and str(store[4]) == "1 x4 + 1 x5 >= 1"
+
+
+def test_rup_php65():
+    proof = check("rup_php65")
+    assert len(proof.model.constraint_db) == proof.model.no_of_constraints - 5
+    assert proof.model.peak_live < proof.model.no_of_constraints
+
+
+def test_cutting_planes_proof():
+    proof = check("proof")
+    # `w` steps wipe the constraints derived at a level as soon as it is left
+    assert proof.model.peak_live == 451
+    # every live constraint the propagator knows is counted in exactly one class
+    propagator = proof.model.propagator
+    assert propagator.class_counts == {"clause": 420, "cardinality": 20, "general": 0}
+    assert sum(propagator.class_counts.values()) + len(propagator.falsified) == (
+        len(proof.model.constraint_db) - len(proof.model.alias_of))
+
+
+def test_trimmed_proof_still_checks(tmp_path, capsys):
+    trimmer = ProofTrimmer(os.path.join(PROOFS, "proof.opb"), os.path.join(PROOFS, "proof.pbp"))
+    output = str(tmp_path / "trimmed.pbp")
+    stats = trimmer.write(output, hints=True)
+    assert stats["kept"] < stats["steps"]
+    capsys.readouterr()
+    proof = PBProof(os.path.join(PROOFS, "proof.opb"), output)
+    assert proof.model.no_of_constraints == proof.no_of_formulas + stats["kept"]
+    assert "hints insufficient" not in capsys.readouterr().out
+
+
+def test_stale_rup_hints_fall_back(tmp_path, capsys):
+    model = tmp_path / "model.opb"
+    model.write_text("1 x1 1 x2 >= 1 ;\n1 ~x1 1 x2 >= 1 ;\n1 x1 1 ~x2 >= 1 ;\n1 ~x1 1 ~x2 >= 1 ;\n")
+    proof = tmp_path / "proof.pbp"
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 4\nu 1 x2 >= 1 ;\nd 5\n"
+                     "u 1 x2 >= 1 ; 5 999 1 2\nu >= 1 ; 5 999\nc 7\n")
+    PBProof(str(model), str(proof))
+    assert "hints insufficient" in capsys.readouterr().out
+
+
+def test_trimming_renumbers_existing_hints(tmp_path, capsys):
+    model = tmp_path / "model.opb"
+    model.write_text("1 x1 1 x2 >= 1 ;\n1 ~x1 1 x2 >= 1 ;\n1 x1 1 ~x2 >= 1 ;\n1 ~x1 1 ~x2 >= 1 ;\n")
+    proof = tmp_path / "proof.pbp"
+    # step 5 is not needed, so step 6 becomes 5 and its id in the hints of step 7 has to follow
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 4\nu 1 x1 1 x2 1 x3 >= 1 ;\n"
+                     "u 1 x2 >= 1 ; 1 2\nu >= 1 ; 6 3 4\nc 7\n")
+    output = tmp_path / "trimmed.pbp"
+    assert ProofTrimmer(str(model), str(proof)).write(str(output)) == {"steps": 3, "kept": 2}
+    assert "u >= 1 ; 5 3 4" in output.read_text().splitlines()
+    capsys.readouterr()
+    PBProof(str(model), str(output))
+    assert "hints insufficient" not in capsys.readouterr().out
+
+
+def test_parallel_checking(tmp_path):
+    proof = ParallelProof(os.path.join(PROOFS, "rup_php65.opb"), os.path.join(PROOFS, "rup_php65.pbp"), workers=2)
+    assert proof.failed == [] and len(proof.model.obligations) == 175
+    # the sequential pass keeps the bookkeeping of PBModel
+    assert proof.model.max_coefficient_bits == 1 and proof.model.peak_live == 181
+    bad = tmp_path / "bad.pbp"
+    bad.write_text("pseudo-Boolean proof version 1.0\nf 11\nu 1 x1 >= 1 ;\nu 1 ~x5 1 x26 1 x27 1 x28 1 x29 >= 1 ;\n")
+    with pytest.raises(Exception, match="constraints 12$"):
+        ParallelProof(os.path.join(PROOFS, "rup_php65.opb"), str(bad), workers=2)
+
+
+def test_parallel_deletion_within_a_run(tmp_path):
+    model = tmp_path / "model.opb"
+    model.write_text("1 x1 >= 1 ;\n1 ~x1 1 x2 >= 1 ;\n")
+    proof = tmp_path / "proof.pbp"
+    # constraint 2 is live when the run starts and deleted between its two obligations
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 2 0\nu 1 x1 >= 1 ;\nd 2 0\nu 1 x2 >= 1 ;\n")
+    with pytest.raises(Exception, match="RUP Failed"):
+        PBProof(str(model), str(proof), tracer=Tracer(QUIET))
+    with pytest.raises(Exception, match="constraints 4$"):
+        ParallelProof(str(model), str(proof), workers=1, tracer=Tracer(QUIET))
+
+
+def test_generated_php_proofs_check(tmp_path):
+    for name, model_file, proof_file in php_instances(str(tmp_path), 3):
+        proof = PBProof(model_file, proof_file)
+        assert proof.model.no_of_constraints > proof.no_of_formulas
+
+
+def test_profiler_reports_partial_run(tmp_path):
+    bad = tmp_path / "bad.pbp"
+    bad.write_text("pseudo-Boolean proof version 1.0\nf 11\nu 1 x1 >= 1 ;\nu 1 ~x5 1 x26 1 x27 1 x28 1 x29 >= 1 ;\n")
+    report = tmp_path / "report.json"
+    with pytest.raises(Exception, match="RUP Failed"):
+        PBProof(os.path.join(PROOFS, "rup_php65.opb"), str(bad), profiler=Profiler(str(report)))
+    report = json.loads(report.read_text())
+    assert not report["finished"]
+    assert report["rules"]["u"]["count"] == 1 and report["rules"]["u"]["propagations"] > 0
+    assert [step["line"] for step in report["slowest"] if step["rule"] == "u"] == [3]
+
+
+def test_quiet_and_veripb_traces(tmp_path, capsys):
+    capsys.readouterr()
+    paths = (os.path.join(PROOFS, "proof.opb"), os.path.join(PROOFS, "proof.pbp"))
+    PBProof(*paths, tracer=Tracer(QUIET))
+    assert capsys.readouterr().out == ""
+    trace = tmp_path / "proof.trace"
+    tracer = Tracer(output=str(trace), veripb=True, level=STEPS)
+    PBProof(*paths, tracer=tracer)
+    tracer.close()
+    lines = trace.read_text().splitlines()
+    assert lines[0] == "=== begin trace ===" and lines[-1] == "Verification succeeded."
+    assert lines[lines.index("line 011: w 1") + 1] == "  ConstraintId  - : deleting 231, 232, 233, 234"
+    assert "  ConstraintId 2531: >= 1" in lines
+
+
+def test_trail_levels():
+    trail = Trail(2)
+    trail.assign(1)
+    trail.new_level()
+    trail.assign(-2)
+    trail.assign(5)  # grows the value array
+    assert 1 in trail and -2 in trail and 5 in trail and 2 not in trail and -5 not in trail
+    assert trail.value(2) == -1 and trail.value(3) == 0 and trail.level_of(5) == 1
+    trail.backtrack(0)
+    assert list(trail) == [1] and trail.level == 0 and trail.value(-2) == 0
+    trail.clear()
+    trail.assign(-1)
+    assert sorted(PBConstraint([1, 2, 3], [1, 1, 1], 2).propagate(trail)) == [2, 3]
+
+
+def test_rup_checker_propagates_units():
+    formula = [[8, 9, 2, 3], [8, 9, -2, 3], [8, 9, 4, -3], [8, 9, -4, -3]]
+    assert RUPchecker(formula, [[8, 9, -3], [8, 9, 3], [8, 9]]).RUPchecker() == "refutation validated"
+    # only RUP through a chain of two propagations
+    assert RUPchecker([[1, 2], [-2, 3], [-3, 4]], [[1, 4]]).RUPchecker() == "refutation validated"
+    assert RUPchecker([[1, 2], [-2, 3]], [[4]]).RUPchecker() == "validation failed"
+
+
+def test_backward_rup_checker_trims():
+    formula = [[8, 9, 2, 3], [8, 9, -2, 3], [8, 9, 4, -3], [8, 9, -4, -3], [-8], [-9, 1], [-1, -9], [5, 7]]
+    proof = [[8, 9, -3], [8, 9, 3], [8, 9], [5, 6], ("d", [5, 6]), [9], []]
+    checker = BackwardRUPchecker(formula, proof)
+    assert checker.check() == "refutation validated"
+    assert checker.core == [0, 1, 2, 3, 4, 5, 6]
+    assert [5, 6] not in checker.trimmed and checker.trimmed[-2:] == [[9], []]
+    # the final conflict needs [8, 9], which is not RUP without [8, 9, -3] and [8, 9, 3]
+    checker = BackwardRUPchecker(formula, [[8, 9], []])
+    assert checker.check() == "validation failed" and checker.failed == [8, 9]
+    # [-1] is RUP only until [-1, 4] is deleted
+    formula = [[1, 2], [-2, 3], [-1, 4], [-1, -4], [-3, 5], [-3, -5]]
+    assert BackwardRUPchecker(formula, [[-1], [-3], []]).check() == "refutation validated"
+    assert BackwardRUPchecker(formula, [("d", [-1, 4]), [-1], [-3], []]).check() == "validation failed"
+    assert BackwardRUPchecker(formula, [[8, 9, -3]]).check() == "invalid refutation"
+
+
+def test_cdcl_solver_proofs_check(tmp_path):
+    holes = 5
+    formula = [[p * holes + h + 1 for h in range(holes)] for p in range(holes + 1)]
+    formula += [[-(p * holes + h + 1), -(q * holes + h + 1)]
+                for h in range(holes) for p in range(holes + 1) for q in range(p + 1, holes + 1)]
+    solver = CDCLSolver(formula, str(tmp_path / "php.pbp"), restart_interval=10, reduce_interval=20)
+    solver.write_opb(str(tmp_path / "php.opb"))
+    assert not solver.solve()
+    proof = PBProof(str(tmp_path / "php.opb"), str(tmp_path / "php.pbp"), tracer=Tracer(QUIET))
+    assert proof.contradiction and len(proof.model.constraint_db) < proof.model.no_of_constraints
+    # without the last pigeon the formula is satisfiable
+    formula = [clause for clause in formula if all(abs(literal) <= holes * holes for literal in clause)]
+    solver = CDCLSolver(formula)
+    assert solver.solve()
+    assert all(any(literal in solver.solution for literal in clause) for clause in formula)
+
+
+def test_interned_duplicates_share_storage(tmp_path):
+    store = ConstraintStore()
+    store[1] = PBConstraint([1, 2], [1, 2], 2)
+    store[2] = PBConstraint([3], [1], 1)
+    store.alias(3, 1)
+    del store[1]
+    del store[2]
+    store.compact()
+    assert len(store.literals) == 2 and str(store[3]) == str(PBConstraint([1, 2], [1, 2], 2))
+
+    model = tmp_path / "model.opb"
+    model.write_text("1 x1 1 x2 >= 1 ;\n-1 ~x2 -1 ~x1 >= -1 ;\n1 ~x1 >= 1 ;\n")
+    proof = tmp_path / "proof.pbp"
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 3 0\nd 1 0\nu 1 x2 >= 1 ;\n")
+    checked = PBProof(str(model), str(proof), record_dependencies=True, tracer=Tracer(QUIET))
+    assert checked.model.redundant == 1 and set(checked.model.dependencies[4]) == {2, 3}
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 3 0\nd 1 2 0\nu 1 x2 >= 1 ;\n")
+    with pytest.raises(Exception, match="RUP Failed"):
+        PBProof(str(model), str(proof), tracer=Tracer(QUIET))
+    assert check("proof").model.redundant == 200
+
+
+def test_j_steps_checked_by_implication(tmp_path):
+    source = PBConstraint([1, 2, 3], [2, 1, 1], 3)
+    assert source.implies(PBConstraint([1, 2], [1, 1], 1))
+    assert not source.implies(PBConstraint([2, 3], [1, 1], 2))
+    # weakening x2 leaves 2 x1 + x3 >= 2, which saturates to x1 + x3 >= 1
+    assert PBConstraint([1, 2, 3], [2, 1, 1], 3).implies(PBConstraint([1, 3], [1, 1], 1))
+
+    model = tmp_path / "model.opb"
+    model.write_text("2 x1 1 x2 1 x3 >= 3 ;\n")
+    proof = tmp_path / "proof.pbp"
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 1 0\nj 1 1 x1 1 x3 >= 1 ;\n")
+    PBProof(str(model), str(proof), tracer=Tracer(QUIET))
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 1 0\nj 1 1 x2 1 x3 >= 2 ;\n")
+    with pytest.raises(Exception, match="Implication Failed"):
+        PBProof(str(model), str(proof), tracer=Tracer(QUIET))
+    assert check("proof").model.implication_fallbacks == 0
+
+
+def test_compiled_proofs_check(tmp_path):
+    model = os.path.join(PROOFS, "proof.opb")
+    text = os.path.join(PROOFS, "proof.pbp")
+    compiled = str(tmp_path / "proof.pbc")
+    assert compile_proof(model, text, compiled) < os.path.getsize(text)
+    steps = list(Tokenizer().proof(text))
+    assert list(CompiledTokenizer().proof(compiled, 100)) == [
+        step._replace(args=tuple(int(a) if a.isdigit() else a for a in step.args) if step.kind == "p" else step.args)
+        for step in steps[100:]]
+    proof = PBProof(compiled, tracer=Tracer(QUIET))
+    assert proof.contradiction and proof.model.no_of_constraints == check("proof").model.no_of_constraints
+
+
+def test_checkpoint_resume(tmp_path):
+    model = os.path.join(PROOFS, "proof.opb")
+    snapshot = str(tmp_path / "proof.snapshot")
+    checkpointer = Checkpointer(snapshot, every=1000)
+    full = PBProof(model, os.path.join(PROOFS, "proof.pbp"), tracer=Tracer(QUIET), checkpointer=checkpointer)
+    assert checkpointer.written >= 1 and Checkpointer.load(snapshot)["steps"] >= 1000
+    resumed = PBProof(model, os.path.join(PROOFS, "proof.pbp"), tracer=Tracer(QUIET), resume=snapshot)
+    assert resumed.contradiction and resumed.model.no_of_constraints == full.model.no_of_constraints
+    # a compiled proof resumes by step index
+    compiled = str(tmp_path / "proof.pbc")
+    compile_proof(model, os.path.join(PROOFS, "proof.pbp"), compiled)
+    PBProof(compiled, tracer=Tracer(QUIET), checkpointer=Checkpointer(snapshot, every=1000))
+    resumed = PBProof(compiled, tracer=Tracer(QUIET), resume=snapshot)
+    assert resumed.contradiction and resumed.model.redundant == full.model.redundant
+
+
+def test_follow_proof_being_written(tmp_path):
+    lines = open(os.path.join(PROOFS, "proof.pbp"), "rb").read().splitlines(keepends=True)
+
+    def write(path, mode):
+        with open(path, mode) as f:
+            for k in range(0, len(lines), 500):
+                f.write(b"".join(lines[k:k + 500]))
+                f.flush()
+                time.sleep(0.01)
+
+    fifo = str(tmp_path / "proof.fifo")
+    os.mkfifo(fifo)
+    writer = threading.Thread(target=write, args=(fifo, "wb"))
+    writer.start()
+    proof = PBProof(os.path.join(PROOFS, "proof.opb"), fifo, tracer=Tracer(QUIET), follow=True)
+    writer.join()
+    assert proof.contradiction and proof.model.no_of_constraints == 2531
+    # a regular file is followed until the conclusion
+    growing = str(tmp_path / "proof.pbp")
+    open(growing, "wb").close()
+    writer = threading.Thread(target=write, args=(growing, "ab"))
+    writer.start()
+    proof = PBProof(os.path.join(PROOFS, "proof.opb"), growing, tracer=Tracer(QUIET), follow=True, idle_timeout=10)
+    writer.join()
+    assert proof.contradiction
+
+
+def test_root_trail_kept_between_checks():
+    propagator = Propagator()
+    propagator.add(1, PBConstraint([1], [1], 1))
+    propagator.add(2, PBConstraint([-1, 2], [1, 1], 1))
+    propagator.add(3, PBConstraint([3, 4], [1, 1], 1))
+    assert propagator.check(PBConstraint([-2], [1], 1)) and propagator.antecedents == {1, 2}
+    assert list(propagator.trail) == [1, 2] and propagator.root == 2
+    # added constraints are propagated against the root
+    propagator.add(4, PBConstraint([-2, -3], [1, 1], 1))
+    assert propagator.check(PBConstraint([-4], [1], 1)) and propagator.antecedents == {1, 2, 3, 4}
+    assert list(propagator.trail) == [1, 2, -3, 4]
+    # removing a reason of the root rebuilds it, other removals keep it
+    propagator.remove(3)
+    assert not propagator.check(PBConstraint([-4], [1], 1)) and propagator.root == 3
+    propagator.remove(1)
+    assert not propagator.check(PBConstraint([-2], [1], 1)) and len(propagator.trail) == 0
+
+
+def test_coefficient_growth(tmp_path):
+    model = tmp_path / "model.opb"
+    model.write_text("2 x1 1 x2 1 x3 >= 2 ;\n1 x1 1 ~x2 >= 1 ;\n")
+    proof = tmp_path / "proof.pbp"
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 2 0\np 1 1000000000000000000000 * 0\np 1 2 + 0\n")
+    checked = PBProof(str(model), str(proof), tracer=Tracer(QUIET))
+    assert checked.model.bigints == 1 and checked.model.max_coefficient_bits == 71
+    # the propagator works on the reduced constraint 2 x1 + x2 + x3 >= 2
+    assert checked.model.propagator.terms[3] == {1: 2, 2: 1, 3: 1} and checked.model.propagator.degrees[3] == 2
+    assert str(checked.model.constraint_db[4]) in ("3 x1 + 1 x3 >= 2", "1 x3 + 3 x1 >= 2")
+    saturated = PBProof(str(model), str(proof), tracer=Tracer(QUIET), saturate=True)
+    assert str(saturated.model.constraint_db[4]) in ("2 x1 + 1 x3 >= 2", "1 x3 + 2 x1 >= 2")
+
+
+def test_trace_index(tmp_path):
+    trace = tmp_path / "proof.trace"
+    tracer = Tracer(output=str(trace), veripb=True, level=STEPS)
+    PBProof(os.path.join(PROOFS, "proof.opb"), os.path.join(PROOFS, "proof.pbp"), tracer=tracer)
+    tracer.close()
+    with TraceIndex(str(trace)) as index:
+        assert index.text(2531) == ">= 1" and index.origin(231) == 5 and index.text(99999) is None
+        assert list(index.step(11)) == [b"line 011: w 1", b"  ConstraintId  - : deleting 231, 232, 233, 234"]
+    with TraceIndex(str(trace), save=False) as index:  # read back from proof.trace.idx
+        assert list(index.offsets) and index.origin(231) == 5
+    graph = tmp_path / "graph"
+    graph.write_text("1 x1 >= 1 ; 1 = \n1 ~x1 >= 1 ; 2 = \n>= 1 ; 3 = 1 2\n")
+    with TraceIndex(str(graph)) as index:
+        assert index.text(3) == ">= 1" and index.antecedents(3) == [1, 2] and index.antecedents(1) == []
+    assert list(grep(str(graph), b"~x1")) == [b"1 ~x1 >= 1 ; 2 = "]
+    assert len(list(grep(str(trace), rb"^line \d+: w ", regex=True))) == len(list(grep(str(trace), b": w ")))
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_batch_slack(vectorized):
+    if vectorized:
+        pytest.importorskip("numpy")
+    engine = BatchSlack(vectorized=vectorized)
+    engine.add(1, PBConstraint([1, 2, 3], [1, 1, 1], 2))
+    engine.add(2, PBConstraint([-3, 4], [2, 1], 2))
+    engine.add(3, PBConstraint([5, 6], [1, 1], 1))
+    assert engine.check(PBConstraint([-1, -4], [1, 1], 2)) and engine.antecedents == {1, 2}
+    assert not engine.check(PBConstraint([-4], [1], 1))
+    assert engine.check(PBConstraint([-5, -6], [1, 1], 2)) and engine.antecedents == {3}
+    engine.remove(2)
+    assert not engine.check(PBConstraint([-1, -4], [1, 1], 2))
+    proof = PBProof(os.path.join(PROOFS, "proof.opb"), os.path.join(PROOFS, "proof.pbp"), tracer=Tracer(QUIET),
+                    batch_slack=True, vectorized=vectorized)
+    assert proof.contradiction and isinstance(proof.model.propagator, BatchSlack)
+
+
+def test_lazy_materialization(tmp_path, capsys):
+    model = tmp_path / "model.opb"
+    model.write_text("1 x1 1 x2 >= 1 ;\n1 ~x1 1 x2 >= 1 ;\n")
+    proof = tmp_path / "proof.pbp"
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 2 0\n# 1\np 1 2 + 0\nw 1\np 1 2 + 0\nu 1 x2 >= 1 ;\n")
+    lazy = PBProof(str(model), str(proof), tracer=Tracer(QUIET), lazy=True)
+    # the first sum is wiped before the RUP step and the constraint it derives is never used
+    assert lazy.model.never_materialized == 1 and lazy.model.materialized == 3
+    assert 3 not in lazy.model.propagator.clauses and 4 in lazy.model.propagator.clauses
+    assert str(lazy.model.constraint_db[4]) == "2 x2 >= 1" and list(lazy.model.unmaterialized) == [5]
+    paths = (os.path.join(PROOFS, "proof.opb"), os.path.join(PROOFS, "proof.pbp"))
+    snapshot = str(tmp_path / "proof.snapshot")
+    full = PBProof(*paths, tracer=Tracer(QUIET), lazy=True, checkpointer=Checkpointer(snapshot, every=1000))
+    assert full.contradiction and full.model.never_materialized > 0
+    resumed = PBProof(*paths, tracer=Tracer(QUIET), lazy=True, resume=snapshot)
+    assert resumed.contradiction and resumed.model.no_of_constraints == full.model.no_of_constraints
+    hinted = tmp_path / "hinted.pbp"
+    hinted.write_text("pseudo-Boolean proof version 1.0\nf 4\nu 1 x2 >= 1 ; 1 2\nu >= 1 ; 5 3 4\nc 6\n")
+    four = tmp_path / "four.opb"
+    four.write_text("1 x1 1 x2 >= 1 ;\n1 ~x1 1 x2 >= 1 ;\n1 x1 1 ~x2 >= 1 ;\n1 ~x1 1 ~x2 >= 1 ;\n")
+    capsys.readouterr()
+    PBProof(str(four), str(hinted), lazy=True)
+    # every RUP step is answered from its hints, so none of the six stored constraints is materialized
+    assert "MATERIALIZED CONSTRAINTS:  0 -- NEVER MATERIALIZED:  6" in capsys.readouterr().out
+
+
+def test_cardinality_watches():
+    propagator = Propagator()
+    propagator.add(1, PBConstraint([1, 2, 3, 4, 5], [1, 1, 1, 1, 1], 3))  # watches x1 x2 x3 x4
+    propagator.add(2, PBConstraint([-4, 6], [1, 1], 1))
+    assert propagator.class_counts == {"clause": 1, "cardinality": 1, "general": 0}
+    # ~x1 moves a watch to x5, ~x2 leaves exactly three: x3 x4 x5, then x6 by the clause
+    assert propagator.check(PBConstraint([-1, -2, -6], [1, 1, 1], 3)) and propagator.antecedents == {1, 2}
+    assert propagator.class_propagations["cardinality"] == 3
+    assert not propagator.check(PBConstraint([-1, -2], [1, 1], 2)) and 5 in propagator.cardinalities[1][:4]
+    # added under a root that leaves it propagating
+    propagator.add(3, PBConstraint([7], [1], 1))
+    assert not propagator.check(PBConstraint([-1], [1], 1)) and list(propagator.trail) == [7]
+    propagator.add(4, PBConstraint([-7, 8, 9], [1, 1, 1], 2))
+    assert propagator.pending == [4]
+    assert propagator.check(PBConstraint([-8], [1], 1)) and propagator.antecedents == {3, 4}
+    propagator.remove(1)
+    assert not propagator.check(PBConstraint([-1, -2, -3], [1, 1, 1], 3))
+    # neither the negated constraints of the checks nor removed ones are counted
+    assert propagator.class_counts == {"clause": 2, "cardinality": 1, "general": 0}
+
+
+def test_equals_steps_are_checked(tmp_path):
+    model = tmp_path / "model.opb"
+    model.write_text("1 x1 1 ~x2 >= 1 ;\n")
+    proof = tmp_path / "proof.pbp"
+    proof.write_text("pseudo-Boolean proof version 1.0\nf 1 0\ne 1 1 ~x2 1 x1 >= 1 ;\ne 1 -1 x2 1 x1 >= 0 ;\n")
+    checked = PBProof(str(model), str(proof), tracer=Tracer(QUIET))
+    assert checked.model.no_of_constraints == 1
+    for wrong in ("e 1 1 x1 1 ~x2 >= 2 ;", "e 2 1 x1 1 ~x2 >= 1 ;"):
+        proof.write_text("pseudo-Boolean proof version 1.0\nf 1 0\n" + wrong + "\n")
+        with pytest.raises(Exception, match="Equality Check Failed"):
+            PBProof(str(model), str(proof), tracer=Tracer(QUIET))
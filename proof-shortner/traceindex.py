@@ -0,0 +1,251 @@
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from typing import Iterator, List, Optional
+
+from tokenizer import read_lines
+
+MAGIC = b"PTI\x01"
+HEADER = struct.Struct("<QQQQQ")  # size and mtime of the indexed file, lengths of the three columns
+MISSING = -1
+
+
+def put(column: array, index: int, value: int) -> None:
+    if index >= len(column):
+        column.extend(array("q", [MISSING]) * (index + 1 - len(column)))
+    column[index] = value
+
+
+class TraceIndex:
+    """
+    Random access to the artifacts of a check: traces in the format of VeriPB --trace (or of `--veripb`),
+    where every proof line is echoed as `line NNN: ...` followed by the constraints it derived as
+    `  ConstraintId NNN: ...`, and proof graphs, which have one `constraint ; id = antecedents` line per
+    constraint.
+
+    One pass over the file records the byte offset of every constraint id and every echoed proof line in
+    arrays indexed by the id and the line number, so a lookup is a subscription and a slice of the mapped
+    file however long the file or the line is. The index is kept next to the file as `<file>.idx` and
+    reused for as long as the size and modification time of the file are unchanged.
+    """
+
+    def __init__(self, filename: str, save: bool = True):
+        """
+        :param: save: write the index next to the file if it had to be built
+        """
+        self.filename = filename
+        self.index_file = filename + ".idx"
+        self.offsets = array("q")  # constraint id -> offset of its line
+        self.origins = array("q")  # constraint id -> proof line that derived it, traces only
+        self.lines = array("q")  # proof line number -> offset of its echo, traces only
+        stat = os.stat(filename)
+        self.stamp = (stat.st_size, stat.st_mtime_ns)
+        self.file = open(filename, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        if not self.load():
+            self.build()
+            if save:
+                self.save()
+
+    def close(self) -> None:
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self) -> "TraceIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def build(self) -> None:
+        offsets, origins, lines = self.offsets, self.origins, self.lines
+        line_no = MISSING
+        for _, offset, line in read_lines(self.filename):
+            if line.startswith(b"  ConstraintId "):
+                cid = line[15:line.index(b":")].strip()
+                if cid != b"-":  # deletions
+                    put(offsets, int(cid), offset)
+                    put(origins, int(cid), line_no)
+            elif line.startswith(b"line "):
+                line_no = int(line[5:line.index(b":")])
+                put(lines, line_no, offset)
+            else:
+                semicolon = line.find(b";")
+                equals = line.find(b"=", semicolon)
+                if semicolon >= 0 and equals >= 0:
+                    put(offsets, int(line[semicolon + 1:equals]), offset)
+
+    def load(self) -> bool:
+        """
+        :return: False if there is no index for the current contents of the file.
+        """
+        try:
+            with open(self.index_file, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        start = len(MAGIC) + HEADER.size
+        if not data.startswith(MAGIC) or len(data) < start:
+            return False
+        size, mtime, *lengths = HEADER.unpack_from(data, len(MAGIC))
+        if (size, mtime) != self.stamp or len(data) != start + 8 * sum(lengths):
+            return False
+        for column, length in zip((self.offsets, self.origins, self.lines), lengths):
+            column.frombytes(data[start:start + 8 * length])
+            start += 8 * length
+            if sys.byteorder != "little":
+                column.byteswap()
+        return True
+
+    def save(self) -> None:
+        columns = (self.offsets, self.origins, self.lines)
+        data = [MAGIC, HEADER.pack(*self.stamp, *map(len, columns))]
+        for column in columns:
+            if sys.byteorder != "little":
+                column = array("q", column)
+                column.byteswap()
+            data.append(column.tobytes())
+        try:
+            with open(self.index_file, "wb") as f:
+                f.write(b"".join(data))
+        except OSError:
+            pass  # a read-only directory only costs the next lookup a rebuild
+
+    def line_at(self, offset: int) -> bytes:
+        end = self.map.find(b"\n", offset)
+        return self.map[offset:end if end >= 0 else len(self.map)]
+
+    def entry(self, cid: int) -> Optional[bytes]:
+        """
+        :return: the line of constraint `cid`, None if the file does not have it.
+        """
+        if 0 <= cid < len(self.offsets) and self.offsets[cid] != MISSING:
+            return self.line_at(self.offsets[cid])
+        return None
+
+    def text(self, cid: int) -> Optional[str]:
+        """
+        :return: the constraint `cid` as written in the file, None if the file does not have it.
+        """
+        line = self.entry(cid)
+        if line is None:
+            return None
+        if line.startswith(b"  ConstraintId "):
+            return line[line.index(b":") + 1:].decode().strip()
+        return line[:line.index(b";")].decode().strip()
+
+    def antecedents(self, cid: int) -> Optional[List[int]]:
+        """
+        :return: the ids constraint `cid` was derived from, None if the file does not have it.
+        """
+        line = self.entry(cid)
+        if line is None:
+            return None
+        if line.startswith(b"  ConstraintId "):
+            raise ValueError(self.filename + " is a trace, antecedents are in the proof graph")
+        return [int(i) for i in line[line.index(b"=", line.index(b";")) + 1:].split()]
+
+    def origin(self, cid: int) -> Optional[int]:
+        """
+        :return: the number of the proof line that derived constraint `cid`, None if it is not in the trace.
+        """
+        if 0 <= cid < len(self.origins) and self.origins[cid] != MISSING:
+            return self.origins[cid]
+        return None
+
+    def step(self, line_no: int) -> Iterator[bytes]:
+        """
+        :return: the echo of proof line `line_no` followed by the constraints it derived and deleted.
+        """
+        if not 0 <= line_no < len(self.lines) or self.lines[line_no] == MISSING:
+            return
+        offset = self.lines[line_no]
+        line = self.line_at(offset)
+        yield line
+        offset += len(line) + 1
+        while offset < len(self.map):
+            line = self.line_at(offset)
+            if not line.startswith(b"  "):
+                break
+            yield line
+            offset += len(line) + 1
+
+
+def grep(file, pattern: bytes, regex: bool = False, invert: bool = False) -> Iterator[bytes]:
+    """
+    Streams the lines of `file` that contain `pattern` (or match it as a regular expression), or with
+    `invert` the ones that do not. A path is read in large chunks, a file object such as a pipe one line at
+    a time so that matches come out as soon as their line has been written.
+    """
+    search = re.compile(pattern).search if regex else None
+    if isinstance(file, str):
+        lines = (line for _, _, line in read_lines(file))
+    else:
+        lines = (line.rstrip(b"\n") for line in iter(file.readline, b""))
+    for line in lines:
+        if (search(line) is not None if regex else pattern in line) != invert:
+            yield line
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Look up and filter VeriPB traces and proof graphs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="print constraints with their antecedents or proof line")
+    show.add_argument("file")
+    show.add_argument("ids", type=int, nargs="+")
+    line = commands.add_parser("line", help="print proof lines of a trace with what they derived")
+    line.add_argument("file")
+    line.add_argument("line_numbers", type=int, nargs="+")
+    index = commands.add_parser("index", help="build the index of a file ahead of lookups")
+    index.add_argument("file")
+    search = commands.add_parser("grep", help="stream the lines containing a substring")
+    search.add_argument("pattern")
+    search.add_argument("file", nargs="?", default="-", help="- for stdin")
+    search.add_argument("-e", "--regex", action="store_true", help="the pattern is a regular expression")
+    search.add_argument("-v", "--invert", action="store_true", help="the lines that do not match")
+    search.add_argument("--line-buffered", action="store_true", help="flush after every line")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout.buffer
+    try:
+        if args.command == "grep":
+            file = sys.stdin.buffer if args.file == "-" else args.file
+            for match in grep(file, os.fsencode(args.pattern), args.regex, args.invert):
+                out.write(match + b"\n")
+                if args.line_buffered:
+                    out.flush()
+            out.flush()
+            return 0
+        with TraceIndex(args.file) as trace:
+            if args.command == "index":
+                print("%d constraints, %d proof lines" % (
+                    sum(1 for offset in trace.offsets if offset != MISSING),
+                    sum(1 for offset in trace.lines if offset != MISSING)))
+            elif args.command == "show":
+                for cid in args.ids:
+                    text = trace.text(cid)
+                    if text is None:
+                        print("%d: not found" % cid)
+                        continue
+                    print("%d: %s" % (cid, text))
+                    if trace.origin(cid) is not None:
+                        print("  derived by line %d" % trace.origin(cid))
+                    elif not trace.entry(cid).startswith(b"  ConstraintId "):
+                        print("  antecedents: " + " ".join(map(str, trace.antecedents(cid))))
+            else:
+                for line_no in args.line_numbers:
+                    for entry in trace.step(line_no):
+                        out.write(entry + b"\n")
+                out.flush()
+    except BrokenPipeError:  # e.g. piped into head
+        sys.stderr.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import os
+import sys
+from typing import List
+
+from propagator import Propagator
+
+QUIET = 0  # nothing at all
+INFO = 1  # the outcome of the check and anything unexpected on the way
+STEPS = 2  # every derived constraint and RUP step
+DEBUG = 3  # also the assignments under which RUP steps are checked
+
+
+class Tracer:
+    """
+    Buffered, level-controlled output of the checker. Callers test `level` before building a message, so
+    a quiet run never formats a constraint:
+
+        if tracer.level >= STEPS:
+            tracer.write("RUP STEP: " + str(constraint))
+
+    With `veripb` set, STEPS output follows the trace format of VeriPB (`proof.trace`): every proof line is
+    echoed as `line NNN: ...`, followed by the constraints it derived as `ConstraintId NNN: ...` and the ones
+    it deleted. Model constraints are listed under the `f` line as VeriPB does.
+    """
+
+    def __init__(self, level: int = INFO, output=None, veripb: bool = False, buffer_size: int = 1 << 16):
+        """
+        :param: output: a path, a file descriptor, a text file, or None for whatever sys.stdout is when flushing
+        :param: buffer_size: the number of characters collected before they are written out
+        """
+        self.level = level
+        self.veripb = veripb
+        self.buffer_size = buffer_size
+        self.buffer: List[str] = []
+        self.buffered = 0
+        self.deleted: List[int] = []  # ids deleted by the current proof line, for the VeriPB trace
+        self.proof_file = None
+        self.owned = None
+        if isinstance(output, str):
+            self.owned = self.output = open(output, "w")
+        elif isinstance(output, int):
+            self.owned = self.output = os.fdopen(output, "w", closefd=False)
+        else:
+            self.output = output
+
+    def write(self, message: str) -> None:
+        self.buffer.append(message)
+        self.buffered += len(message) + 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            output = self.output or sys.stdout
+            self.buffer.append("")
+            output.write("\n".join(self.buffer))
+            output.flush()
+            self.buffer.clear()
+            self.buffered = 0
+
+    def close(self) -> None:
+        self.flush()
+        if self.owned is not None:
+            self.owned.close()
+            self.owned = None
+
+    @staticmethod
+    def veripb_format(constraint) -> str:
+        terms, degree = Propagator.normalized_terms(constraint)
+        parts = [("%d x%d" % (coefficient, literal)) if literal > 0 else ("%d ~x%d" % (coefficient, -literal))
+                 for literal, coefficient in terms.items()]
+        parts.append(">= %d" % degree)
+        return " ".join(parts)
+
+    def added(self, cid: int, constraint) -> None:
+        """
+        Traces a new constraint; only called at level STEPS and above.
+        """
+        if not self.veripb:
+            self.write("constraint " + str(cid) + " added:  " + str(constraint))
+        elif self.proof_file is not None:
+            self.write("  ConstraintId %03d: %s" % (cid, self.veripb_format(constraint)))
+
+    def begin(self, proof_file) -> None:
+        """
+        Starts the VeriPB trace of `proof_file`.
+        """
+        self.proof_file = open(proof_file, "rb")
+        self.write("=== begin trace ===")
+
+    def line(self, step) -> None:
+        """
+        Echoes the proof line of `step` in the VeriPB trace.
+        """
+        self.flush_deleted()
+        self.proof_file.seek(step.offset)
+        self.write("line %03d: %s" % (step.line_no, self.proof_file.readline().decode().rstrip()))
+
+    def flush_deleted(self) -> None:
+        if self.deleted:
+            self.write("  ConstraintId  - : deleting " + ", ".join(map(str, self.deleted)))
+            self.deleted.clear()
+
+    def end(self, succeeded: bool) -> None:
+        self.flush_deleted()
+        self.proof_file.close()
+        self.proof_file = None
+        self.write("=== end trace ===\n")
+        self.write("Verification succeeded." if succeeded else "Verification failed.")
@@ -0,0 +1,112 @@
+from array import array
+from typing import Iterator, List
+
+
+class Trail:
+    """
+    A partial assignment kept as a stack of true literals with decision level marks.
+
+    `values` is indexed by signed literals: `values[l]` is 1 iff the literal l is true. A negative literal
+    -v wraps around to the upper half of the array, so looking a literal up is a single subscription with
+    neither `abs` nor a branch, and `-l in trail` reads "l is false". `positions` is indexed the same way and
+    holds the index of a true literal on the stack.
+
+    Lookups of variables above `no_of_variables` would wrap onto other variables, so anything that indexes
+    `values` directly must `ensure` its variables first; `in` does the range check itself.
+    """
+
+    def __init__(self, no_of_variables: int = 0):
+        self.no_of_variables = 0
+        self.values = bytearray(1)
+        self.positions = array("i", [0])
+        self.literals: List[int] = []
+        self.marks: List[int] = []  # stack length at the start of decision levels 1, 2, ...
+        self.ensure(no_of_variables)
+
+    def ensure(self, variable: int) -> None:
+        """
+        Makes room for the variables up to `variable`; the array is resized geometrically.
+        """
+        if variable <= self.no_of_variables:
+            return
+        n = max(variable, 2 * self.no_of_variables)
+        self.values = bytearray(2 * n + 1)
+        self.positions = array("i", bytes(4 * (2 * n + 1)))
+        self.no_of_variables = n
+        for position, literal in enumerate(self.literals):
+            self.values[literal] = 1
+            self.positions[literal] = position
+
+    def __contains__(self, literal: int) -> bool:
+        """
+        :return: True if `literal` is true.
+        """
+        n = self.no_of_variables
+        return -n <= literal <= n and self.values[literal] == 1
+
+    def value(self, literal: int) -> int:
+        """
+        :return: 1 if `literal` is true, -1 if it is false and 0 if it is unassigned.
+        """
+        if literal in self:
+            return 1
+        return -1 if -literal in self else 0
+
+    def assign(self, literal: int) -> None:
+        """
+        Pushes `literal`, which must be unassigned, at the current decision level.
+        """
+        if literal > self.no_of_variables or -literal > self.no_of_variables:
+            self.ensure(abs(literal))
+        self.values[literal] = 1
+        self.positions[literal] = len(self.literals)
+        self.literals.append(literal)
+
+    def new_level(self) -> None:
+        self.marks.append(len(self.literals))
+
+    @property
+    def level(self) -> int:
+        return len(self.marks)
+
+    def level_of(self, literal: int) -> int:
+        """
+        :return: the decision level at which the true literal `literal` was assigned.
+        """
+        position = self.positions[literal]
+        level = len(self.marks)
+        while level and self.marks[level - 1] > position:
+            level -= 1
+        return level
+
+    def backtrack(self, level: int = 0) -> None:
+        """
+        Unassigns every literal above decision level `level`.
+        """
+        if level < len(self.marks):
+            self.truncate(self.marks[level])
+            del self.marks[level:]
+
+    def truncate(self, length: int) -> None:
+        """
+        Unassigns the literals from index `length` of the stack on.
+        """
+        values = self.values
+        for literal in self.literals[length:]:
+            values[literal] = 0
+        del self.literals[length:]
+        while self.marks and self.marks[-1] > length:
+            self.marks.pop()
+
+    def clear(self) -> None:
+        self.truncate(0)
+        self.marks.clear()
+
+    def __len__(self) -> int:
+        return len(self.literals)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.literals)
+
+    def __getitem__(self, index):
+        return self.literals[index]
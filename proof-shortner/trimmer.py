@@ -0,0 +1,107 @@
+import sys
+from typing import Dict, Set
+
+from pb_constraint import PBProof
+from cutting_planes import PolEvaluator
+from tokenizer import read_lines
+
+
+class ProofTrimmer:
+    """
+    Shortens a VeriPB proof. One forward check records, for each derived constraint, the constraints it was
+    derived from: the operands of `p` steps, the source of `j` steps and the conflict core of `u` steps.
+    Marking backwards from the contradiction then tells which steps are needed, and the others are dropped
+    while writing the proof out again with renumbered ids.
+
+    The RUP dependencies can also be written as hints after the `;` of a `u` step, `u 1 x1 1 x2 >= 1 ; 3 17`, which lets
+    PBModel.rup propagate only those constraints when re-checking.
+    """
+
+    def __init__(self, model_file, proof_file):
+        self.proof_file = proof_file
+        self.proof = PBProof(model_file, proof_file, record_dependencies=True)
+        self.no_of_formulas = self.proof.no_of_formulas
+        self.contradiction = self.find_contradiction()
+        self.needed = self.mark()
+
+    def find_contradiction(self) -> int:
+        for step in self.proof.model.tokenizer.proof(self.proof_file):
+            if step.kind == "c":
+                return step.args[0]
+        raise Exception("the proof does not claim a contradiction, nothing to trim")
+
+    def mark(self) -> Set[int]:
+        """
+        :return: the ids of the derived constraints the contradiction depends on.
+        """
+        dependencies = self.proof.model.dependencies
+        needed = set()
+        stack = [self.contradiction]
+        while stack:
+            cid = stack.pop()
+            if cid in needed or cid <= self.no_of_formulas:
+                continue
+            needed.add(cid)
+            stack.extend(dependencies[cid])
+        return needed
+
+    def write(self, output_file, hints: bool = False) -> Dict[str, int]:
+        """
+        Writes the shortened proof to `output_file`, with RUP hints if `hints` is set.
+        :return: the number of derivation steps before and after trimming.
+        """
+        renumber = {cid: cid for cid in range(1, self.no_of_formulas + 1)}
+        cid = self.no_of_formulas
+        kept = 0
+        with open(output_file, "w") as out:
+            for line_no, offset, line in read_lines(self.proof_file):
+                line = line.decode()
+                tokens = line.split()
+                if not tokens or tokens[0].startswith("*"):
+                    continue
+                rule = tokens[0]
+                if rule in ("u", "p", "j"):
+                    cid += 1
+                    if cid not in self.needed:
+                        continue
+                    kept += 1
+                    renumber[cid] = self.no_of_formulas + kept
+                    if rule == "p":
+                        operands = tokens[1:]
+                        end = [operands.pop()] if operands and operands[-1] == "0" else []
+                        ids = iter(PolEvaluator.operand_ids(operands))
+                        for k, token in enumerate(operands):
+                            if token not in PolEvaluator.operations and not (
+                                    k + 1 < len(operands) and operands[k + 1] in ("*", "/")):
+                                operands[k] = str(renumber[next(ids)])
+                        line = " ".join(["p"] + operands + end)
+                    elif rule == "u" and (hints or ";" in line):
+                        # hints already in the proof name the old ids, dropped ones are left out
+                        constraint, _, tail = line.partition(";")
+                        if hints:
+                            hint_ids = [renumber[i] for i in self.proof.model.dependencies[cid]]
+                        else:
+                            hint_ids = [renumber[int(i)] for i in tail.split() if int(i) in renumber]
+                        line = " ".join(constraint.split() + [";"] + [str(i) for i in hint_ids])
+                    elif rule == "j":
+                        line = " ".join(["j", str(renumber[int(tokens[1])])] + tokens[2:])
+                elif rule == "d":
+                    ids = [str(renumber[int(i)]) for i in tokens[1:] if int(i) in renumber]
+                    if not ids:
+                        continue
+                    line = " ".join(["d"] + ids)
+                elif rule == "c" or rule == "e":
+                    if int(tokens[1]) not in renumber:
+                        continue
+                    line = " ".join([rule, str(renumber[int(tokens[1])])] + tokens[2:])
+                out.write(line + "\n")
+        return {"steps": cid - self.no_of_formulas, "kept": kept}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('Usage: %s model_file proof_file output_file [--hints]' % sys.argv[0])
+        sys.exit(1)
+    trimmer = ProofTrimmer(sys.argv[1], sys.argv[2])
+    stats = trimmer.write(sys.argv[3], hints="--hints" in sys.argv[4:])
+    print("TRIMMED PROOF -- KEPT", stats["kept"], "OF", stats["steps"], "DERIVATION STEPS")
@@ -1,22 +1,21 @@
 # remove all lines that don't have a certain substring in them in a file
 # Usage: python cleantrace.py <filename> <substring>
+# For filtering without rewriting the file, or by a regular expression, see proof-shortner/traceindex.py grep.
 
+import os
 import sys
 
 if len(sys.argv) != 3:
-    print "Usage: python cleantrace.py <filename> <substring>"
+    print("Usage: python cleantrace.py <filename> <substring>")
     sys.exit(1)
 
 filename = sys.argv[1]
-substring = sys.argv[2]
+substring = os.fsencode(sys.argv[2])
 
-f = open(filename, 'r')
-lines = f.readlines()
-for line in lines:
-    if substring not in line:
-        lines.remove(line)
-f.close()
-
-f = open(filename, 'w')
-f.writelines(lines)
-f.close()
+# one pass into a temporary file next to the original, which replaces it only once it is complete
+temporary = filename + ".tmp"
+with open(filename, 'rb') as f, open(temporary, 'wb') as out:
+    for line in f:
+        if substring in line:
+            out.write(line)
+os.replace(temporary, filename)